@@ -0,0 +1,195 @@
+# actions.py
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+import discord
+from discord.http import handle_message_parameters
+
+ACTIONS_RATE = float(os.getenv("ACTIONS_RATE", "40"))  # أقل من الحد العام لديسكورد (50/ث)
+DELETE_BATCH_SECONDS = 0.25
+LOG_BATCH_SECONDS = 2.0
+BULK_DELETE_MAX_AGE = timedelta(days=13, hours=23)  # bulk-delete يرفض الرسائل الأقدم من 14 يوم
+MEMBER_ROLE_UPDATE = discord.AuditLogAction.member_role_update.value
+
+# ====== منفّذ عقوبات الحماية ======
+# handle_message لا ينتظر أي REST: يضيف الإجراء هنا ويكمل. لكل "bucket" (قناة للحذف،
+# سيرفر للـ timeout، قناة للّوق) عامل واحد يجمع الطلبات المتراكمة ويرسلها على دفعات:
+# الحذف المتعدد في نفس القناة = bulk-delete، العضو الواحد = timeout واحد، واللوق = embeds مجمّعة،
+# وسحب الرتب لكل سيرفر بعامل واحد.
+class ModerationExecutor:
+    def __init__(self, http, rate: float = ACTIONS_RATE):
+        self.http = http
+        self.rate = rate
+        self._next_slot = 0.0
+        self._deletes = {}    # channel_id -> {message_id: None}
+        self._timeouts = {}   # guild_id -> {user_id: (seconds, reason)}
+        self._timed_out = {}  # (guild_id, user_id) -> monotonic وقت انتهاء الـ timeout
+        self._logs = {}       # channel_id -> OrderedDict(line -> count)
+        self._role_removals = {}  # guild_id -> {(user_id, role_id): reason}
+        self._workers = {}    # bucket -> Task
+        self.stats = {"requests": 0, "deleted": 0, "timeouts": 0, "roles_removed": 0, "log_messages": 0, "deduped": 0, "errors": 0}
+
+    # ---- الإضافة (بدون await) ----
+    def delete(self, channel_id: int, message_id: int):
+        pending = self._deletes.setdefault(channel_id, {})
+        if message_id in pending:
+            self.stats["deduped"] += 1
+            return
+        pending[message_id] = None
+        self._kick(("delete", channel_id), self._run_deletes)
+
+    def timeout(self, guild_id: int, user_id: int, seconds: int, reason: str):
+        key = (guild_id, user_id)
+        pending = self._timeouts.setdefault(guild_id, {})
+        if user_id in pending or self._timed_out.get(key, 0) > time.monotonic():
+            self.stats["deduped"] += 1
+            return
+        pending[user_id] = (seconds, reason)
+        self._kick(("timeout", guild_id), self._run_timeouts)
+
+    def remove_roles(self, guild_id: int, user_id: int, role_ids, reason: str):
+        pending = self._role_removals.setdefault(guild_id, {})
+        for role_id in role_ids:
+            if (user_id, role_id) in pending:
+                self.stats["deduped"] += 1
+            else:
+                pending[(user_id, role_id)] = reason
+        self._kick(("roles", guild_id), self._run_role_removals)
+
+    async def role_audit(self, guild_id: int, after: int = None):
+        # قراءة (ليست في طابور) لكنها تمر بنفس التوزيع الزمني حتى لا تنافس العقوبات على الحد العام
+        await self._throttle()
+        self.stats["requests"] += 1
+        try:
+            return await self.http.get_audit_logs(guild_id, limit=100, after=after, action_type=MEMBER_ROLE_UPDATE)
+        except discord.HTTPException:
+            self.stats["errors"] += 1
+            return None
+
+    def log(self, channel_id: int, line: str):
+        lines = self._logs.setdefault(channel_id, OrderedDict())
+        lines[line] = lines.get(line, 0) + 1
+        self._kick(("log", channel_id), self._run_logs)
+
+    def pending(self) -> int:
+        # عدد العمّال (buckets) الذين لديهم عمل جارٍ
+        return len(self._workers)
+
+    async def drain(self):
+        while self._workers:
+            await asyncio.gather(*list(self._workers.values()), return_exceptions=True)
+
+    async def close(self, timeout: float = 5.0):
+        try:
+            await asyncio.wait_for(self.drain(), timeout)
+        except asyncio.TimeoutError:
+            for task in self._workers.values():
+                task.cancel()
+
+    # ---- العمّال ----
+    def _kick(self, bucket, run):
+        task = self._workers.get(bucket)
+        if task is None or task.done():
+            task = self._workers[bucket] = asyncio.ensure_future(run(bucket[1]))
+            task.add_done_callback(lambda t: self._workers.pop(bucket) if self._workers.get(bucket) is t else None)
+
+    async def _throttle(self):
+        # توزيع الطلبات على الوقت بدل إرسالها دفعة واحدة ثم أكل 429 عام
+        now = time.monotonic()
+        wait = self._next_slot - now
+        self._next_slot = max(self._next_slot, now) + 1 / self.rate
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    async def _call(self, coro_fn, *args, **kwargs) -> bool:
+        await self._throttle()
+        self.stats["requests"] += 1
+        try:
+            await coro_fn(*args, **kwargs)
+            return True
+        except discord.NotFound:
+            return True  # محذوفة أو العضو خرج مسبقاً
+        except discord.HTTPException:
+            self.stats["errors"] += 1
+            return False
+
+    async def _run_deletes(self, channel_id: int):
+        await asyncio.sleep(DELETE_BATCH_SECONDS)
+        cutoff = discord.utils.utcnow() - BULK_DELETE_MAX_AGE
+        while self._deletes.get(channel_id):
+            pending = self._deletes[channel_id]
+            ids = list(pending)[:100]
+            for mid in ids:
+                del pending[mid]
+            bulk = [m for m in ids if discord.utils.snowflake_time(m) > cutoff]
+            if len(bulk) >= 2:
+                if await self._call(self.http.delete_messages, channel_id, bulk, reason="Protection"):
+                    self.stats["deleted"] += len(bulk)
+                done = set(bulk)
+                singles = [m for m in ids if m not in done]
+            else:
+                singles = ids
+            for mid in singles:
+                if await self._call(self.http.delete_message, channel_id, mid, reason="Protection"):
+                    self.stats["deleted"] += 1
+        self._deletes.pop(channel_id, None)
+
+    async def _run_timeouts(self, guild_id: int):
+        while self._timeouts.get(guild_id):
+            user_id, (seconds, reason) = self._timeouts[guild_id].popitem()
+            until = datetime.now(timezone.utc) + timedelta(seconds=seconds)
+            self._timed_out[(guild_id, user_id)] = time.monotonic() + seconds
+            if await self._call(
+                self.http.edit_member, guild_id, user_id,
+                reason=reason, communication_disabled_until=until.isoformat()
+            ):
+                self.stats["timeouts"] += 1
+        self._timeouts.pop(guild_id, None)
+        now = time.monotonic()
+        for key in [k for k, t in self._timed_out.items() if t <= now]:
+            del self._timed_out[key]
+
+    async def _run_role_removals(self, guild_id: int):
+        while self._role_removals.get(guild_id):
+            (user_id, role_id), reason = self._role_removals[guild_id].popitem()
+            if await self._call(self.http.remove_role, guild_id, user_id, role_id, reason=reason):
+                self.stats["roles_removed"] += 1
+        self._role_removals.pop(guild_id, None)
+
+    async def _run_logs(self, channel_id: int):
+        await asyncio.sleep(LOG_BATCH_SECONDS)
+        while self._logs.get(channel_id):
+            lines = self._logs.pop(channel_id)
+            chunks, desc = [], ""
+            for line, count in lines.items():
+                text = f"{line} (×{count})" if count > 1 else line
+                if desc and len(desc) + len(text) + 1 > 4000:
+                    chunks.append(desc)
+                    desc = ""
+                desc += text[:3990] + "\n"
+            chunks.append(desc)
+
+            # رسالة واحدة تحمل حتى 10 embeds بشرط ألا يتجاوز مجموع النص 6000 حرف
+            batch, size = [], 0
+            for i, desc in enumerate(chunks):
+                batch.append(discord.Embed(description=desc, color=discord.Color.orange()))
+                size += len(desc)
+                nxt = len(chunks[i + 1]) if i + 1 < len(chunks) else None
+                if nxt is None or len(batch) == 10 or size + nxt > 6000:
+                    with handle_message_parameters(embeds=batch) as params:
+                        if await self._call(self.http.send_message, channel_id, params=params):
+                            self.stats["log_messages"] += 1
+                    batch, size = [], 0
+
+_executor = None
+
+def setup_moderation(http) -> ModerationExecutor:
+    global _executor
+    _executor = ModerationExecutor(http)
+    return _executor
+
+def moderation() -> ModerationExecutor:
+    return _executor
@@ -0,0 +1,463 @@
+# assistant.py
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+from collections import OrderedDict, deque
+
+from openai import AsyncOpenAI
+
+from db import (
+    get_cached_answer, put_cached_answer, purge_answer_cache,
+    get_conversation, save_conversation, delete_conversation, purge_conversations
+)
+from metrics import METRICS_ENABLED, observe, inc, gauge
+from protection import normalize_text
+
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-5.2")
+ASK_GLOBAL_CONCURRENCY = int(os.getenv("ASK_GLOBAL_CONCURRENCY", "16"))
+ASK_GUILD_CONCURRENCY = int(os.getenv("ASK_GUILD_CONCURRENCY", "2"))
+ASK_MAX_QUEUE = int(os.getenv("ASK_MAX_QUEUE", "200"))
+ASK_TIMEOUT = float(os.getenv("ASK_TIMEOUT", "60"))
+ASK_STREAM = os.getenv("ASK_STREAM", "1") == "1"
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", "86400"))  # 0 = معطّل
+ANSWER_CACHE_BYTES = int(os.getenv("ANSWER_CACHE_BYTES", str(4 * 1024 * 1024)))
+ANSWER_CACHE_SCOPE = os.getenv("ANSWER_CACHE_SCOPE", "guild")  # guild | global
+
+class AssistantBusy(Exception):
+    pass
+
+class AssistantFailed(Exception):
+    pass
+
+_client = None
+
+def client() -> AsyncOpenAI:
+    global _client
+    if _client is None:
+        _client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), timeout=ASK_TIMEOUT, max_retries=1)
+    return _client
+
+def build_prompt(question: str, context: str = "") -> str:
+    if context:
+        return f"You are a helpful Discord assistant. Answer clearly.\n\n{context}\n\nUser: {question}"
+    return f"You are a helpful Discord assistant. Answer clearly.\n\nUser: {question}"
+
+# ====== حدود التزامن ======
+# سقف عام + سقف لكل سيرفر، وطابور انتظار محدود: لو امتلأ نرفض فوراً بدل تكديس الطلبات.
+_global_slots = asyncio.Semaphore(ASK_GLOBAL_CONCURRENCY)
+_guild_slots = {}  # guild_id -> [Semaphore, users]
+_waiting = 0
+
+# نفس السؤال أثناء تنفيذه = طلب واحد للـ API يتشاركه الجميع
+_inflight = {}
+
+class _Stream:
+    """One upstream completion; any number of followers read its text as it arrives."""
+    __slots__ = ("parts", "changed", "task", "complete")
+
+    def __init__(self):
+        self.parts = []
+        self.changed = asyncio.Event()
+        self.task = None
+        self.complete = False  # وصل response.completed؛ الجواب المقطوع لا يُحفظ في الكاش ولا في الذاكرة
+
+    def push(self, delta: str):
+        if delta:
+            self.parts.append(delta)
+            self.changed.set()
+
+    async def follow(self):
+        # يعيد كل ما وصل منذ آخر قراءة كقطعة واحدة، فالمستهلك البطيء لا يتأخر خلف الـ stream
+        seen = 0
+        while True:
+            if seen < len(self.parts):
+                chunk = "".join(self.parts[seen:])
+                seen = len(self.parts)
+                yield chunk
+                continue
+            if self.task.done():
+                self.task.result()  # يرفع الخطأ إن وجد
+                return
+            self.changed.clear()
+            await self.changed.wait()
+
+async def ask(guild_id: int, question: str, conv: "Conversation" = None) -> str:
+    context = conv.context() if conv is not None else ""
+    stream = _ask_upstream(guild_id, build_prompt(question, context))
+    # shield: لو ألغى أحد المنتظرين لا يُلغى الطلب على الباقين
+    text = await asyncio.shield(stream.task)
+    if stream.complete:
+        await _after_answer(guild_id, question, text, conv, context)
+    return text
+
+async def ask_stream(guild_id: int, question: str, conv: "Conversation" = None):
+    # مثل ask لكن يُرجع النص على دفعات أثناء التوليد (ASK_STREAM=0 = دفعة واحدة في النهاية)
+    context = conv.context() if conv is not None else ""
+    stream = _ask_upstream(guild_id, build_prompt(question, context))
+    async for chunk in stream.follow():
+        yield chunk
+    if stream.complete:
+        await _after_answer(guild_id, question, stream.task.result(), conv, context)
+
+async def _after_answer(guild_id: int, question: str, text: str, conv, context: str):
+    if not text:
+        return
+    if conv is not None:
+        await remember_turn(conv, question, text)
+    if not context:  # جواب يعتمد على محادثة سابقة لا يصلح لكاش الأسئلة
+        await _remember_answer(guild_id, question, text)
+
+def _ask_upstream(guild_id: int, prompt: str) -> _Stream:
+    key = (OPENAI_MODEL, prompt)
+    stream = _inflight.get(key)
+    if stream is None:
+        stream = _inflight[key] = _Stream()
+        task = stream.task = asyncio.ensure_future(_limited(guild_id, prompt, stream))
+        task.add_done_callback(lambda t: _inflight.pop(key, None) if _inflight.get(key) is stream else None)
+        task.add_done_callback(lambda t: stream.changed.set())
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    return stream
+
+async def _limited(guild_id: int, prompt: str, out: _Stream) -> str:
+    global _waiting
+    if _waiting >= ASK_MAX_QUEUE:
+        raise AssistantBusy()
+
+    slot = _guild_slots.get(guild_id)
+    if slot is None:
+        slot = _guild_slots[guild_id] = [asyncio.Semaphore(ASK_GUILD_CONCURRENCY), 0]
+    slot[1] += 1
+    _waiting += 1
+    queued = True
+    try:
+        async with slot[0], _global_slots:
+            _waiting -= 1
+            queued = False
+            return await _complete(prompt, out)
+    finally:
+        if queued:
+            _waiting -= 1
+        slot[1] -= 1
+        if slot[1] == 0:
+            _guild_slots.pop(guild_id, None)
+
+async def _complete(prompt: str, out: _Stream) -> str:
+    # ASK_TIMEOUT يحدّ انتظار أول token والفجوة بين tokens، لا طول الجواب كله
+    start = time.perf_counter()
+    if not ASK_STREAM:
+        r = await asyncio.wait_for(client().responses.create(model=OPENAI_MODEL, input=prompt), ASK_TIMEOUT)
+        if r.status == "failed":
+            raise AssistantFailed(r.error.message if r.error else "response failed")
+        text = (r.output_text or "").strip()
+        out.push(text)
+        out.complete = r.status == "completed"
+    else:
+        parts, r = [], None
+        events = await asyncio.wait_for(
+            client().responses.create(model=OPENAI_MODEL, input=prompt, stream=True), ASK_TIMEOUT
+        )
+        async with events:
+            it = events.__aiter__()
+            while True:
+                try:
+                    event = await asyncio.wait_for(it.__anext__(), ASK_TIMEOUT)
+                except StopAsyncIteration:
+                    break
+                if event.type == "response.output_text.delta":
+                    if not parts and METRICS_ENABLED:
+                        observe("openai_ttft_seconds", time.perf_counter() - start, model=OPENAI_MODEL)
+                    parts.append(event.delta)
+                    out.push(event.delta)
+                elif event.type == "response.completed":
+                    r = event.response
+                    out.complete = True
+                elif event.type == "response.incomplete":
+                    r = event.response  # مقطوع (حد tokens مثلاً): يُعرض كما هو لكن لا يُحفظ
+                elif event.type == "response.failed":
+                    error = event.response.error
+                    raise AssistantFailed(error.message if error else "response failed")
+                elif event.type == "error":
+                    raise AssistantFailed(event.message)
+        text = "".join(parts).strip()
+    if METRICS_ENABLED:
+        observe("openai_seconds", time.perf_counter() - start, model=OPENAI_MODEL)
+        _count_tokens(r)
+    return text
+
+def _count_tokens(response):
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        inc("openai_tokens_total", usage.input_tokens or 0, kind="input")
+        inc("openai_tokens_total", usage.output_tokens or 0, kind="output")
+
+# ====== كاش الأجوبة ======
+# واجهة LRU في الذاكرة (محدودة بالبايت) أمام جدول answer_cache في bot.db
+_PUNCT = re.compile(r"[^\w\s]+")
+_answers = OrderedDict()  # key -> (answer, expires_at, size)
+_answers_bytes = 0
+_puts = 0
+cache_stats = {"hits": 0, "misses": 0}
+
+def cache_key(guild_id: int, question: str) -> str:
+    norm = " ".join(_PUNCT.sub(" ", normalize_text(question)).split())
+    scope = guild_id if ANSWER_CACHE_SCOPE == "guild" else 0
+    return hashlib.sha256(f"{OPENAI_MODEL}\0{scope}\0{norm}".encode()).hexdigest()
+
+def _forget(key: str):
+    global _answers_bytes
+    entry = _answers.pop(key, None)
+    if entry:
+        _answers_bytes -= entry[2]
+
+def _keep(key: str, answer: str, expires_at: float):
+    global _answers_bytes
+    _forget(key)
+    size = len(answer.encode())
+    if size > ANSWER_CACHE_BYTES:
+        return
+    _answers[key] = (answer, expires_at, size)
+    _answers_bytes += size
+    while _answers_bytes > ANSWER_CACHE_BYTES:
+        _, (_, _, old) = _answers.popitem(last=False)
+        _answers_bytes -= old
+
+async def cached_answer(guild_id: int, question: str):
+    if ANSWER_CACHE_TTL <= 0:
+        return None
+    key = cache_key(guild_id, question)
+    now = time.time()
+    entry = _answers.get(key)
+    if entry is not None:
+        if entry[1] > now:
+            _answers.move_to_end(key)
+            cache_stats["hits"] += 1
+            return entry[0]
+        _forget(key)
+
+    row = await get_cached_answer(key)
+    if row and row[1] + ANSWER_CACHE_TTL > now:
+        _keep(key, row[0], row[1] + ANSWER_CACHE_TTL)
+        cache_stats["hits"] += 1
+        return row[0]
+    cache_stats["misses"] += 1
+    return None
+
+async def _remember_answer(guild_id: int, question: str, answer: str):
+    global _puts
+    if ANSWER_CACHE_TTL <= 0:
+        return
+    key = cache_key(guild_id, question)
+    if key in _answers:
+        return  # طلب مدموج سبق وحفظه
+    now = time.time()
+    _keep(key, answer, now + ANSWER_CACHE_TTL)
+    await put_cached_answer(key, guild_id, OPENAI_MODEL, answer, now)
+    _puts += 1
+    if _puts % 200 == 0:
+        await purge_answer_cache(now - ANSWER_CACHE_TTL)
+
+gauge("answer_cache_hits", lambda: cache_stats["hits"])
+gauge("answer_cache_misses", lambda: cache_stats["misses"])
+gauge("answer_cache_bytes", lambda: _answers_bytes)
+
+def answer_cache_info() -> dict:
+    total = cache_stats["hits"] + cache_stats["misses"]
+    return {
+        **cache_stats,
+        "hit_rate": cache_stats["hits"] / total if total else 0.0,
+        "entries": len(_answers),
+        "bytes": _answers_bytes,
+    }
+
+# ====== ذاكرة المحادثة ======
+# لكل محادثة (سيرفر، قناة، عضو — أو القناة كلها مع CONTEXT_SCOPE=channel) حلقة من آخر الأدوار محدودة
+# بعددها وبميزانية tokens تقريبية (4 أحرف ≈ token). ما يخرج من الحلقة يُلخّص في الخلفية ويُدمج في الملخص،
+# فيبقى حجم الـ prompt ثابتاً تقريباً. نص السياق يُبنى مرة واحدة ويُعاد استخدامه حتى الدور التالي.
+CONTEXT_SCOPE = os.getenv("CONTEXT_SCOPE", "user")  # user | channel
+CONTEXT_TOKENS = int(os.getenv("CONTEXT_TOKENS", "1500"))  # 0 = معطّلة
+CONTEXT_TURNS = int(os.getenv("CONTEXT_TURNS", "12"))
+CONTEXT_TTL = int(os.getenv("CONTEXT_TTL", "21600"))  # محادثة خاملة أطول من هذا تبدأ من جديد
+CONTEXT_GUILD_CHARS = int(os.getenv("CONTEXT_GUILD_CHARS", "200000"))  # سقف الذاكرة لكل سيرفر
+CONTEXT_MAX_CONVERSATIONS = int(os.getenv("CONTEXT_MAX_CONVERSATIONS", "5000"))
+CONTEXT_TURN_CHARS = 1200  # الجواب الطويل يُحفظ مقصوصاً في الذاكرة
+CONTEXT_SUMMARY_CHARS = 1200
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+class Conversation:
+    __slots__ = (
+        "key", "summary", "turns", "tokens", "chars", "updated_at", "dropped", "summarizing", "generation", "_context"
+    )
+
+    def __init__(self, key: tuple):
+        self.key = key
+        self.summary = ""
+        self.turns = deque()  # (question, answer)
+        self.tokens = 0
+        self.chars = 0
+        self.updated_at = 0.0
+        self.dropped = []     # أدوار خرجت من الحلقة بانتظار التلخيص
+        self.summarizing = False
+        self.generation = 0   # يزيد عند المسح، فالتلخيص الجاري يعرف أن نتيجته لم تعد تخص هذه المحادثة
+        self._context = None
+
+    @property
+    def empty(self) -> bool:
+        return not self.turns and not self.summary
+
+    def context(self) -> str:
+        if self._context is None:
+            parts = [f"Summary of the earlier conversation: {self.summary}"] if self.summary else []
+            parts.extend(f"User: {q}\nAssistant: {a}" for q, a in self.turns)
+            self._context = "\n\n".join(parts)
+        return self._context
+
+    def set_summary(self, summary: str):
+        self.chars += len(summary) - len(self.summary)
+        self.summary = summary
+        self._context = None
+
+    def add(self, question: str, answer: str) -> list:
+        self.turns.append((question, answer))
+        self.tokens += estimate_tokens(question) + estimate_tokens(answer)
+        self.chars += len(question) + len(answer)
+        self._context = None
+        dropped = []
+        while len(self.turns) > 1 and (len(self.turns) > CONTEXT_TURNS or self.tokens > CONTEXT_TOKENS):
+            q, a = self.turns.popleft()
+            self.tokens -= estimate_tokens(q) + estimate_tokens(a)
+            self.chars -= len(q) + len(a)
+            dropped.append((q, a))
+        return dropped
+
+_conversations = OrderedDict()  # key -> Conversation (LRU؛ المحذوف من الذاكرة يبقى في bot.db)
+_guild_chars = {}  # guild_id -> مجموع أحرف محادثاته في الذاكرة
+_summaries = set()  # مهام التلخيص الجارية (مرجع حتى لا تُجمع)
+_saves = 0
+
+def conversation_key(guild_id: int, channel_id: int, user_id: int) -> tuple:
+    return (guild_id, channel_id, user_id if CONTEXT_SCOPE == "user" else 0)
+
+async def conversation(guild_id: int, channel_id: int, user_id: int):
+    if CONTEXT_TOKENS <= 0:
+        return None
+    key = conversation_key(guild_id, channel_id, user_id)
+    now = time.time()
+    conv = _conversations.get(key)
+    if conv is None:
+        row = await get_conversation(*key)
+        conv = _conversations.get(key)  # ربما حمّلها طلب آخر أثناء الانتظار
+        if conv is None:
+            conv = Conversation(key)
+            if row and row[2] + CONTEXT_TTL > now:
+                conv.set_summary(row[0])
+                for q, a in json.loads(row[1]):
+                    conv.add(q, a)
+                conv.updated_at = row[2]
+            _track(conv)
+    elif conv.updated_at + CONTEXT_TTL <= now and not conv.empty:
+        before = conv.chars
+        _reset(conv)
+        _account(conv, before)
+    _conversations.move_to_end(key)
+    return conv
+
+def _reset(conv: Conversation):
+    conv.turns.clear()
+    conv.tokens = 0
+    conv.set_summary("")
+    conv.chars = 0
+    conv.dropped = []
+    conv.generation += 1
+    conv.summarizing = False
+
+async def remember_turn(conv: Conversation, question: str, answer: str):
+    global _saves
+    before = conv.chars
+    dropped = conv.add(question[:CONTEXT_TURN_CHARS], answer[:CONTEXT_TURN_CHARS])
+    conv.updated_at = time.time()
+    _account(conv, before)
+    if dropped:
+        conv.dropped.extend(dropped)
+        if not conv.summarizing:
+            conv.summarizing = True  # قبل الجدولة: remember_turn آخر قبل أن تبدأ المهمة لا يطلق مهمة ثانية
+            task = asyncio.ensure_future(_summarize(conv))
+            _summaries.add(task)
+            task.add_done_callback(_summaries.discard)
+    await _save(conv)
+    _saves += 1
+    if _saves % 200 == 0:
+        await purge_conversations(conv.updated_at - CONTEXT_TTL)
+
+async def forget_conversation(guild_id: int, channel_id: int, user_id: int):
+    key = conversation_key(guild_id, channel_id, user_id)
+    conv = _conversations.pop(key, None)
+    if conv is not None:
+        _guild_chars[key[0]] -= conv.chars
+        _reset(conv)
+    await delete_conversation(*key)
+
+async def _save(conv: Conversation):
+    await save_conversation(
+        *conv.key, conv.summary, json.dumps(list(conv.turns), ensure_ascii=False), conv.updated_at
+    )
+
+def _current(conv: Conversation, generation: int) -> bool:
+    return conv.generation == generation and _conversations.get(conv.key) is conv
+
+async def _summarize(conv: Conversation):
+    generation = conv.generation
+    try:
+        while conv.dropped:
+            dropped, conv.dropped = conv.dropped, []
+            turns = "\n\n".join(f"User: {q}\nAssistant: {a}" for q, a in dropped)
+            prompt = (
+                "Update the running summary of this Discord conversation. Keep names, facts, decisions and "
+                f"open questions. Reply with the summary only, under {CONTEXT_SUMMARY_CHARS // 6} words.\n\n"
+                f"Current summary: {conv.summary or '(none)'}\n\nNew turns:\n{turns}"
+            )
+            try:
+                async with _global_slots:
+                    r = await asyncio.wait_for(
+                        client().responses.create(model=OPENAI_MODEL, input=prompt), ASK_TIMEOUT
+                    )
+                summary = (r.output_text or "").strip() or conv.summary
+            except Exception:
+                summary = conv.summary  # تضيع الأدوار القديمة لكن الذاكرة تبقى محدودة
+            if not _current(conv, generation):
+                return  # مُسحت (/ask_forget أو انتهاء المدة) أو خرجت من الذاكرة: لا نعيد كتابة ما نُسي
+            before = conv.chars
+            conv.set_summary(summary[:CONTEXT_SUMMARY_CHARS])
+            _account(conv, before)
+        await _save(conv)
+    finally:
+        if conv.generation == generation:
+            conv.summarizing = False
+
+def _track(conv: Conversation):
+    _conversations[conv.key] = conv
+    _account(conv, 0)
+    while len(_conversations) > CONTEXT_MAX_CONVERSATIONS:
+        _, old = _conversations.popitem(last=False)
+        _guild_chars[old.key[0]] -= old.chars
+
+def _account(conv: Conversation, before: int):
+    guild_id = conv.key[0]
+    if _conversations.get(conv.key) is not conv:
+        return  # خرجت من الذاكرة (تلخيص متأخر)
+    used = _guild_chars[guild_id] = _guild_chars.get(guild_id, 0) + conv.chars - before
+    if used <= CONTEXT_GUILD_CHARS:
+        return
+    # الأقدم استخداماً من نفس السيرفر يخرج من الذاكرة أولاً (يبقى محفوظاً في bot.db)
+    for key in [k for k in _conversations if k[0] == guild_id and k != conv.key]:
+        used -= _conversations.pop(key).chars
+        if used <= CONTEXT_GUILD_CHARS:
+            break
+    _guild_chars[guild_id] = used
+
+gauge("conversations_in_memory", lambda: len(_conversations))
+gauge("conversation_chars", lambda: sum(_guild_chars.values()))
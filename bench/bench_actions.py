@@ -0,0 +1,88 @@
+# bench/bench_actions.py
+# raid وهمي: N مخالف في عدة قنوات، كل واحد = حذف رسالة + timeout + سطر لوق.
+# يقارن الإرسال المباشر (طلب لكل إجراء) مع ModerationExecutor ضد Discord REST وهمي.
+#
+#   python bench/bench_actions.py --offenders 300 --channels 3
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import discord  # noqa: E402
+from discord.http import HTTPClient, Route, handle_message_parameters  # noqa: E402
+
+import actions  # noqa: E402
+from fake_discord import FakeDiscord  # noqa: E402
+
+GUILD_ID = 100
+LOG_CHANNEL = 999
+
+def _raid(offenders: int, channels: int):
+    base = discord.utils.time_snowflake(discord.utils.utcnow())
+    # كل مخالف يرسل 3 رسائل قبل أن يُعاقب
+    return [(1000 + i % channels, base + i * 3 + k, 5000 + i) for i in range(offenders) for k in range(3)]
+
+async def _naive(http, raid):
+    async def one(channel_id, message_id, user_id):
+        until = (datetime.now(timezone.utc) + timedelta(seconds=60)).isoformat()
+        await http.delete_message(channel_id, message_id)
+        await http.edit_member(GUILD_ID, user_id, communication_disabled_until=until)
+        with handle_message_parameters(content=f"🛡️ Spam: <@{user_id}> in <#{channel_id}>") as params:
+            await http.send_message(LOG_CHANNEL, params=params)
+    await asyncio.gather(*[one(*r) for r in raid], return_exceptions=True)
+
+async def _executor(http, raid):
+    q = actions.ModerationExecutor(http)
+    for channel_id, message_id, user_id in raid:
+        q.delete(channel_id, message_id)
+        q.timeout(GUILD_ID, user_id, 60, "Spam")
+        q.log(LOG_CHANNEL, f"🛡️ Spam: <@{user_id}> in <#{channel_id}>")
+    await q.drain()
+    return q.stats
+
+async def run(args) -> dict:
+    fake = await FakeDiscord(global_limit=args.global_limit).start()
+    Route.BASE = fake.base_url
+    http = HTTPClient(asyncio.get_running_loop())
+    await http.static_login("bench-token")
+    fake.requests = 0
+
+    raid = _raid(args.offenders, args.channels)
+    t0 = time.perf_counter()
+    stats = None
+    if args.mode == "naive":
+        await _naive(http, raid)
+    else:
+        stats = await _executor(http, raid)
+    elapsed = time.perf_counter() - t0
+
+    await http.close()
+    await fake.stop()
+    return {
+        "mode": args.mode,
+        "offenders": args.offenders,
+        "messages": len(raid),
+        "elapsed_s": round(elapsed, 2),
+        "http_requests": fake.requests,
+        "http_429": fake.rate_limited,
+        "actions_per_sec": round(len(raid) / elapsed, 1),
+        "calls": fake.calls,
+        "executor": stats,
+    }
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--mode", choices=["naive", "executor"], default="executor")
+    p.add_argument("--offenders", type=int, default=200)
+    p.add_argument("--channels", type=int, default=3)
+    p.add_argument("--global-limit", type=int, default=50)
+    args = p.parse_args()
+    print(json.dumps(asyncio.run(run(args))))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+# bench/bench_ask.py
+# يقيس تأخر الـ event loop أثناء N طلب /ask متزامن ضد سيرفر OpenAI وهمي.
+#
+#   python bench/bench_ask.py --calls 100 --latency 0.5
+#   python bench/bench_ask.py --calls 100 --sync     # السلوك القديم (OpenAI المتزامن) للمقارنة
+#   python bench/bench_ask.py --calls 20 --stream --answer-words 600   # زمن أول نص والزمن الكلي مع الـ streaming
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_openai import FakeOpenAI  # noqa: E402
+from replies import StreamingReply  # noqa: E402
+
+async def _lag_monitor(samples: list, stop: asyncio.Event, interval: float = 0.01):
+    while not stop.is_set():
+        t = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(time.perf_counter() - t - interval)
+
+async def run(args) -> dict:
+    import assistant
+    import db
+    db.DB_PATH = os.path.join(tempfile.mkdtemp(), "bench.db")  # لا نلمس bot.db
+    await db.init_db()
+    try:
+        return await _measure(args, assistant)
+    finally:
+        await db.close_db()
+
+async def _measure(args, assistant) -> dict:
+
+    if args.sync:
+        from openai import OpenAI
+        sync_ai = OpenAI()
+
+        async def one(i):
+            r = sync_ai.responses.create(model=assistant.OPENAI_MODEL, input=assistant.build_prompt(f"q{i}"))
+            return r.output_text
+    else:
+        await assistant.ask(0, "warmup")  # إنشاء العميل وتحميل موديلات الـ SDK خارج القياس
+
+        async def one(i):
+            # نسبة من الأسئلة مكررة عمداً لقياس دمج الطلبات المتطابقة
+            q = "What are the rules?" if i % 100 < args.duplicate_pct else f"q{i}"
+            if not args.stream:
+                return await assistant.ask(i % args.guilds, q)
+            # نفس مسار /ask: StreamingReply على followup وهمي يسجّل الإرسال والتعديل
+            start = time.perf_counter()
+            followup = _FakeFollowup()
+            reply = StreamingReply(followup, interval=args.edit_interval)
+            async for chunk in assistant.ask_stream(i % args.guilds, q):
+                await reply.push(chunk)
+            await reply.finish()
+            first.append(reply.first_shown_at - start)
+            totals.append(time.perf_counter() - start)
+            edits.append(followup.edits)
+            messages.append(reply.messages)
+    first, totals, edits, messages = [], [], [], []
+
+    lags, stop = [], asyncio.Event()
+    monitor = asyncio.create_task(_lag_monitor(lags, stop))
+    t0 = time.perf_counter()
+    results = await asyncio.gather(*[one(i) for i in range(args.calls)], return_exceptions=True)
+    total = time.perf_counter() - t0
+    stop.set()
+    await monitor
+
+    lags.sort()
+    out = {
+        "mode": "sync" if args.sync else ("stream" if args.stream else "async"),
+        "calls": args.calls,
+        "errors": sum(isinstance(r, Exception) for r in results),
+        "total_s": round(total, 3),
+        "loop_lag_p50_ms": round(statistics.median(lags) * 1000, 2) if lags else None,
+        "loop_lag_p99_ms": round(lags[int(len(lags) * 0.99) - 1] * 1000, 2) if lags else None,
+        "loop_lag_max_ms": round(lags[-1] * 1000, 2) if lags else None,
+    }
+    if first:
+        out.update({
+            "first_text_p50_ms": round(statistics.median(first) * 1000, 1),
+            "first_text_max_ms": round(max(first) * 1000, 1),
+            "answer_p50_ms": round(statistics.median(totals) * 1000, 1),
+            "answer_max_ms": round(max(totals) * 1000, 1),
+            "edits_per_answer": round(statistics.mean(edits), 1),
+            "messages_per_answer": round(statistics.mean(messages), 1),
+        })
+    return out
+
+class _FakeFollowup:
+    def __init__(self):
+        self.edits = 0
+
+    async def send(self, content, wait=False):
+        assert len(content) <= 2000, len(content)
+        return _FakeSent(self)
+
+class _FakeSent:
+    def __init__(self, followup):
+        self.followup = followup
+
+    async def edit(self, content):
+        assert len(content) <= 2000, len(content)
+        self.followup.edits += 1
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--calls", type=int, default=100)
+    p.add_argument("--latency", type=float, default=0.5)
+    p.add_argument("--guilds", type=int, default=10)
+    p.add_argument("--duplicate-pct", type=int, default=20)
+    p.add_argument("--sync", action="store_true")
+    p.add_argument("--stream", action="store_true", help="drive ask_stream through StreamingReply")
+    p.add_argument("--answer-words", type=int, default=2, help="length of the fake answer")
+    p.add_argument("--token-delay", type=float, default=0.02)
+    p.add_argument("--edit-interval", type=float, default=1.2)
+    args = p.parse_args()
+
+    answer = " ".join(["Fake answer."] + [f"word{i}" for i in range(args.answer_words - 2)])
+    fake = FakeOpenAI(latency=args.latency, answer=answer, token_delay=args.token_delay).start()
+    os.environ["OPENAI_BASE_URL"] = fake.base_url
+    os.environ["ASK_STREAM"] = "1" if args.stream else "0"
+    os.environ.setdefault("OPENAI_API_KEY", "fake")
+    try:
+        out = asyncio.run(run(args))
+        out["upstream_requests"] = fake.requests
+    finally:
+        fake.stop()
+    print(json.dumps(out))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+# bench/bench_pipeline.py
+# يشغّل main.on_message و main.on_member_update مباشرة (بدون gateway) على حركة مسجّلة أو مولّدة
+# ويطبع JSON: زمن p50/p99، أحداث/ثانية، استعلامات SQLite لكل حدث، وأقصى ذاكرة.
+#
+#   python bench/bench_pipeline.py                                # كل البروفايلات المولّدة
+#   python bench/bench_pipeline.py --profile raid --events 20000
+#   python bench/bench_pipeline.py --record chat.jsonl --profile chat
+#   python bench/bench_pipeline.py --replay chat.jsonl
+#   python bench/bench_pipeline.py --out new.json --compare old.json
+#   python bench/bench_pipeline.py --profile many_guilds --warm
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+
+import discord  # noqa: E402
+
+import actions  # noqa: E402
+import db  # noqa: E402
+import main  # noqa: E402
+import protection  # noqa: E402
+
+PROFILES = ("chat", "raid", "role_grants", "many_guilds")
+BANNED_WORDS = 500
+DANGEROUS = discord.Permissions(administrator=True).value
+HARMLESS = discord.Permissions(send_messages=True, read_messages=True).value
+_WORDS = "hello there how are you doing today the game was great see you later ok lol nice".split()
+
+# ====== توليد الحركة ======
+# كل حدث dict قابل للتسجيل في JSONL:
+#   {"type": "message", "guild": g, "channel": c, "user": u, "content": "..."}
+#   {"type": "member_update", "guild": g, "user": u, "before": [role ids], "after": [role ids]}
+def generate(profile: str, events: int, seed: int = 1):
+    rng = random.Random(seed)
+    out = []
+    if profile == "chat":
+        for _ in range(events):
+            out.append({"type": "message", "guild": rng.randrange(20), "channel": rng.randrange(5),
+                        "user": rng.randrange(2000), "content": " ".join(rng.choices(_WORDS, k=rng.randint(2, 15)))})
+    elif profile == "raid":
+        for i in range(events):
+            content = rng.choice([
+                "join discord.gg/raid now", "FREE NITRO https://evil.example/gift", "spam spam spam spam",
+                # دعوات مخفية داخل رابط
+                "https://example.com/?r=discord.gg/raid", "https://www.google.com/url?q=https://discord.gg/abc",
+            ])
+            out.append({"type": "message", "guild": 0, "channel": rng.randrange(3),
+                        "user": 100_000 + rng.randrange(max(events // 4, 1)), "content": content})
+    elif profile == "role_grants":
+        for i in range(events):
+            granted = 1 if rng.random() < 0.7 else 2  # 1 = admin role, 2 = harmless role
+            if rng.random() < 0.5:  # نصف الأحداث تغيير nickname/avatar بدون تغيير رتب
+                out.append({"type": "member_update", "guild": 0, "user": i, "before": [3], "after": [3]})
+            else:
+                out.append({"type": "member_update", "guild": 0, "user": i, "before": [3], "after": [3, granted]})
+    elif profile == "many_guilds":
+        for _ in range(events):
+            out.append({"type": "message", "guild": rng.randrange(5000), "channel": 0,
+                        "user": rng.randrange(50_000), "content": " ".join(rng.choices(_WORDS, k=6))})
+    else:
+        raise ValueError(profile)
+    return out
+
+# ====== بدائل discord.Message / discord.Member ======
+class _FakeHTTP:
+    """Swallows REST calls so the moderation executor runs without a network."""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def _ok(self, *args, **kwargs):
+        self.calls += 1
+
+    delete_message = delete_messages = edit_member = send_message = _ok
+    remove_role = add_role = get_audit_logs = _ok
+
+_guilds = {}
+
+def _role(role_id: int, perms: int):
+    return SimpleNamespace(id=role_id, name=f"role-{role_id}", permissions=discord.Permissions(perms),
+                           position=role_id, mention=f"<@&{role_id}>")
+
+def _guild(guild_id: int):
+    g = _guilds.get(guild_id)
+    if g is None:
+        roles = {1: _role(1, DANGEROUS), 2: _role(2, HARMLESS), 3: _role(3, HARMLESS)}
+        g = _guilds[guild_id] = SimpleNamespace(
+            id=guild_id, roles=list(roles.values()), get_role=roles.get,
+            get_channel=lambda cid: None, me=None,
+        )
+    return g
+
+_NO_PERMS = discord.Permissions.none()
+
+def _author(guild, user_id: int, roles=()):
+    return SimpleNamespace(
+        id=user_id, bot=False, mention=f"<@{user_id}>", guild=guild, guild_permissions=_NO_PERMS,
+        roles=[guild.get_role(r) for r in roles], display_name=f"user{user_id}",
+    )
+
+_next_id = [discord.utils.time_snowflake(discord.utils.utcnow())]
+
+def _message(ev):
+    guild = _guild(ev["guild"])
+    _next_id[0] += 1
+    channel = SimpleNamespace(id=ev["channel"] + 1, mention=f"<#{ev['channel'] + 1}>")
+    return SimpleNamespace(
+        id=_next_id[0], guild=guild, channel=channel, content=ev["content"],
+        author=_author(guild, ev["user"]), mentions=[], role_mentions=[], mention_everyone=False,
+        _state=main.bot._connection,
+    )
+
+def _members(ev):
+    guild = _guild(ev["guild"])
+    return _author(guild, ev["user"], ev["before"]), _author(guild, ev["user"], ev["after"])
+
+# ====== التشغيل ======
+async def _prepare(guild_ids):
+    words = [f"badword{i}" for i in range(BANNED_WORDS)]
+    for gid in guild_ids:
+        await db.update_protection_config(gid, log_channel_id=999, roles_enabled=1)
+        for w in words[:50] if len(guild_ids) > 100 else words:
+            await db.add_banned_word(gid, w)
+        db.invalidate_guild_cache(gid)
+
+async def replay(name: str, events: list, use_tracemalloc: bool, warm: bool = False) -> dict:
+    guild_ids = sorted({ev["guild"] for ev in events})
+    await _prepare(guild_ids[:200])
+    if warm:  # كما يفعل on_ready: تحميل كل اللقطات دفعة واحدة قبل الحركة
+        await db.warm_guild_cache(guild_ids)
+
+    queries = [0]
+    await db.set_query_tracer(lambda sql: queries.__setitem__(0, queries[0] + 1))
+    if use_tracemalloc:
+        tracemalloc.start()
+
+    latencies = []
+    t0 = time.perf_counter()
+    for ev in events:
+        if ev["type"] == "message":
+            msg = _message(ev)
+            s = time.perf_counter()
+            await main.on_message(msg)
+        else:
+            before, after = _members(ev)
+            s = time.perf_counter()
+            await main.on_member_update(before, after)
+        latencies.append(time.perf_counter() - s)
+    elapsed = time.perf_counter() - t0
+
+    peak = tracemalloc.get_traced_memory()[1] if use_tracemalloc else None
+    if use_tracemalloc:
+        tracemalloc.stop()
+    await db.set_query_tracer(None)
+    await protection.drain_role_bursts()
+    await actions.moderation().drain()
+
+    latencies.sort()
+    n = len(latencies)
+    return {
+        "profile": name,
+        "events": n,
+        "guilds": len(guild_ids),
+        "events_per_sec": round(n / elapsed, 1),
+        "p50_us": round(latencies[n // 2] * 1e6, 1),
+        "p99_us": round(latencies[min(n - 1, int(n * 0.99))] * 1e6, 1),
+        "max_us": round(latencies[-1] * 1e6, 1),
+        "sql_per_event": round(queries[0] / n, 3),
+        "peak_traced_mb": round(peak / 1e6, 2) if peak is not None else None,
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "rest_calls": actions.moderation().http.calls,
+    }
+
+async def run(args) -> list:
+    db.DB_PATH = os.path.join(tempfile.mkdtemp(), "bench.db")
+    await db.init_db()
+    main.bot._connection.user = SimpleNamespace(id=0)  # process_commands يقارن بـ bot.user.id
+    results = []
+    try:
+        if args.replay:
+            with open(args.replay, encoding="utf-8") as f:
+                events = [json.loads(line) for line in f if line.strip()]
+            todo = [(os.path.basename(args.replay), events)]
+        else:
+            todo = [(p, generate(p, args.events, args.seed)) for p in (args.profile or PROFILES)]
+
+        for name, events in todo:
+            if args.record:
+                with open(args.record, "w", encoding="utf-8") as f:
+                    f.writelines(json.dumps(ev) + "\n" for ev in events)
+            actions.setup_moderation(_FakeHTTP())
+            results.append(await replay(name, events, args.tracemalloc, args.warm))
+    finally:
+        await db.close_db()
+    return results
+
+def _compare(results: list, baseline_path: str):
+    with open(baseline_path, encoding="utf-8") as f:
+        old = {r["profile"]: r for r in json.load(f)}
+    for r in results:
+        base = old.get(r["profile"])
+        if not base:
+            continue
+        diff = {}
+        for k in ("events_per_sec", "p50_us", "p99_us", "sql_per_event", "peak_traced_mb"):
+            if base.get(k) and r.get(k) is not None:
+                diff[k] = f"{(r[k] - base[k]) / base[k]:+.1%}"
+        print(json.dumps({"profile": r["profile"], "vs_baseline": diff}))
+
+def main_cli():
+    p = argparse.ArgumentParser()
+    p.add_argument("--profile", action="append", choices=PROFILES)
+    p.add_argument("--events", type=int, default=5000)
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--replay", help="JSONL file of recorded events")
+    p.add_argument("--record", help="write the generated events to this JSONL file")
+    p.add_argument("--tracemalloc", action="store_true", help="report peak traced memory (slower)")
+    p.add_argument("--warm", action="store_true", help="warm the guild cache before replaying (startup path)")
+    p.add_argument("--out", help="write results JSON here")
+    p.add_argument("--compare", help="previous --out file to diff against")
+    args = p.parse_args()
+
+    results = asyncio.run(run(args))
+    for r in results:
+        print(json.dumps(r))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        _compare(results, args.compare)
+
+if __name__ == "__main__":
+    main_cli()
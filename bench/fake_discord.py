@@ -0,0 +1,88 @@
+# bench/fake_discord.py
+# سيرفر محلي يقلّد مسارات Discord REST التي يستخدمها منفّذ العقوبات، مع حدود سرعة و 429 مثل الحقيقية
+import time
+
+from aiohttp import web
+
+class FakeDiscord:
+    """Per-route buckets plus a global limit; counts requests and 429s."""
+
+    def __init__(self, route_limit: int = 5, route_window: float = 1.0, global_limit: int = 50):
+        self.route_limit = route_limit
+        self.route_window = route_window
+        self.global_limit = global_limit
+        self.requests = 0
+        self.rate_limited = 0
+        self.calls = {}
+        self.base_url = None
+        self._buckets = {}  # bucket -> [remaining, reset_at]
+        self._global = [global_limit, 0.0]
+
+    def _take(self, state: list, limit: int, window: float, now: float):
+        if now >= state[1]:
+            state[0], state[1] = limit, now + window
+        if state[0] <= 0:
+            return state[1] - now
+        state[0] -= 1
+        return 0.0
+
+    @web.middleware
+    async def _limits(self, request: web.Request, handler):
+        now = time.monotonic()
+        self.requests += 1
+        route = request.match_info.route.resource.canonical
+        bucket = f"{request.method} {route} {request.match_info.get('channel_id') or request.match_info.get('guild_id')}"
+        state = self._buckets.setdefault(bucket, [self.route_limit, 0.0])
+
+        retry = self._take(self._global, self.global_limit, 1.0, now)
+        is_global = retry > 0
+        if not is_global:
+            retry = self._take(state, self.route_limit, self.route_window, now)
+        if retry > 0:
+            self.rate_limited += 1
+            return web.json_response(
+                {"message": "You are being rate limited.", "retry_after": round(retry, 3), "global": is_global},
+                status=429,
+                headers={"Via": "1.1 google", "Retry-After": str(retry), "X-RateLimit-Global": str(is_global).lower()},
+            )
+
+        key = f"{request.method} {route}"
+        self.calls[key] = self.calls.get(key, 0) + 1
+        response = await handler(request)
+        response.headers.update({
+            "X-RateLimit-Limit": str(self.route_limit),
+            "X-RateLimit-Remaining": str(max(state[0], 0)),
+            "X-RateLimit-Reset-After": str(round(max(state[1] - now, 0), 3)),
+            "X-RateLimit-Bucket": bucket,
+        })
+        return response
+
+    async def _me(self, request):
+        return web.json_response({"id": "1", "username": "bench", "discriminator": "0", "avatar": None})
+
+    async def _no_content(self, request):
+        return web.Response(status=204)
+
+    async def _member(self, request):
+        return web.json_response({"user": {"id": request.match_info["user_id"], "username": "u", "discriminator": "0", "avatar": None}, "roles": []})
+
+    async def _message(self, request):
+        return web.json_response({"id": "1", "channel_id": request.match_info["channel_id"]})
+
+    async def start(self) -> "FakeDiscord":
+        app = web.Application(middlewares=[self._limits])
+        app.router.add_get("/api/v10/users/@me", self._me)
+        app.router.add_delete("/api/v10/channels/{channel_id}/messages/{message_id}", self._no_content)
+        app.router.add_post("/api/v10/channels/{channel_id}/messages/bulk-delete", self._no_content)
+        app.router.add_post("/api/v10/channels/{channel_id}/messages", self._message)
+        app.router.add_patch("/api/v10/guilds/{guild_id}/members/{user_id}", self._member)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{port}/api/v10"
+        return self
+
+    async def stop(self):
+        await self._runner.cleanup()
@@ -0,0 +1,92 @@
+# bench/fake_openai.py
+# سيرفر محلي يقلّد OpenAI Responses API للاختبار بدون إنترنت وبدون تكلفة
+import asyncio
+import json
+import threading
+
+from aiohttp import web
+
+def _response(text: str, status: str = "completed") -> dict:
+    return {
+        "id": "resp_fake",
+        "object": "response",
+        "created_at": 0,
+        "model": "fake",
+        "status": status,
+        "output": [{
+            "type": "message",
+            "id": "msg_fake",
+            "role": "assistant",
+            "status": "completed",
+            "content": [{"type": "output_text", "text": text, "annotations": []}],
+        }],
+        "parallel_tool_calls": False,
+        "tool_choice": "auto",
+        "tools": [],
+        "usage": {
+            "input_tokens": 0, "input_tokens_details": {"cached_tokens": 0},
+            "output_tokens": len(text.split()), "output_tokens_details": {"reasoning_tokens": 0},
+            "total_tokens": len(text.split()),
+        },
+    }
+
+def _sse(seq: int, event: dict) -> bytes:
+    event["sequence_number"] = seq
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n".encode()
+
+class FakeOpenAI:
+    """Runs the fake endpoint on its own thread so a blocked bot loop can't stall it."""
+
+    def __init__(self, latency: float = 0.5, answer: str = "Fake answer.", token_delay: float = 0.02):
+        self.latency = latency        # قبل أول token (أو قبل الرد كاملاً بدون stream)
+        self.answer = answer
+        self.token_delay = token_delay
+        self.requests = 0
+        self.base_url = None
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+
+    async def _responses(self, request: web.Request):
+        self.requests += 1
+        body = await request.json()
+        text = f"{self.answer} ({len(json.dumps(body.get('input')))} chars in)"
+        await asyncio.sleep(self.latency)
+        if not body.get("stream"):
+            return web.json_response(_response(text))
+
+        resp = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await resp.prepare(request)
+        seq = 0
+        await resp.write(_sse(seq, {"type": "response.created", "response": _response("", "in_progress")}))
+        for i, word in enumerate(text.split(" ")):
+            if i:
+                await asyncio.sleep(self.token_delay)
+            seq += 1
+            await resp.write(_sse(seq, {
+                "type": "response.output_text.delta", "item_id": "msg_fake", "output_index": 0,
+                "content_index": 0, "delta": word if i == 0 else " " + word, "logprobs": [],
+            }))
+        seq += 1
+        await resp.write(_sse(seq, {"type": "response.completed", "response": _response(text)}))
+        await resp.write_eof()
+        return resp
+
+    async def _start(self):
+        app = web.Application()
+        app.router.add_post("/v1/responses", self._responses)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{port}/v1"
+
+    def start(self) -> "FakeOpenAI":
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._start(), self._loop).result()
+        return self
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
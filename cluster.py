@@ -0,0 +1,169 @@
+# cluster.py
+# تشغيل موزّع: عدة عمليات، كل عملية AutoShardedBot تملك مجموعة shards متتالية.
+#   SHARD_COUNT=16 CLUSTERS=4 python cluster.py      (SHARD_COUNT=0 = العدد الذي يقترحه ديسكورد)
+#
+# ملكية حسب السيرفر: ديسكورد يرسل أحداث وأوامر أي سيرفر على shard واحد فقط
+# ((guild_id >> 22) % SHARD_COUNT)، فعدّادات السبام وحصة /ask اليومية وكاش الإعدادات لكل سيرفر
+# تعيش في عملية واحدة ولا تُحسب مرتين. كل العمليات تكتب نفس bot.db (WAL + busy_timeout)،
+# والـ upsert في flush_daily_usage يأخذ MAX فلا تتراجع الحصة لو أعيد تشغيل عملية.
+#
+# إبطال الكاش: كل عملية تنشر تعديلاتها (إعدادات/كلمات/Premium) في طابور واحد، والأب يوزّعها على الباقي.
+import asyncio
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+CLUSTERS = int(os.getenv("CLUSTERS", str(os.cpu_count() or 1)))
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "0"))
+RESTART_BACKOFF = 5.0
+IDENTIFY_SECONDS = 5.0  # ديسكورد: identify واحد لكل 5 ثوان لكل bucket من max_concurrency
+
+def shard_ranges(shard_count: int, clusters: int) -> list:
+    clusters = max(1, min(clusters, shard_count))
+    per, extra = divmod(shard_count, clusters)
+    out, start = [], 0
+    for i in range(clusters):
+        n = per + (1 if i < extra else 0)
+        out.append(list(range(start, start + n)))
+        start += n
+    return out
+
+async def _recommended_shards(token: str):
+    from discord.http import HTTPClient
+
+    http = HTTPClient(asyncio.get_running_loop())
+    try:
+        await http.static_login(token)
+        shards, _, limits = await http.get_bot_gateway()
+        return shards, limits.get("max_concurrency", 1)
+    finally:
+        await http.close()
+
+# ====== العامل (عملية لكل cluster) ======
+def _worker(index: int, shard_ids: list, shard_count: int, inbox, outbox):
+    os.environ["CLUSTER_ID"] = str(index)
+    os.environ["SHARD_COUNT"] = str(shard_count)
+    os.environ["SHARD_IDS"] = ",".join(map(str, shard_ids))
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # الأب يوقف العمّال بـ SIGTERM
+
+    import db
+    import main
+
+    db.set_cache_publisher(lambda event: outbox.put((index, event)))
+    asyncio.run(_run_worker(main, db, inbox))
+
+async def _run_worker(main, db, inbox):
+    loop = asyncio.get_running_loop()
+
+    def listen():
+        while True:
+            event = inbox.get()
+            if event is None:
+                return
+            loop.call_soon_threadsafe(db.apply_cache_event, event)
+
+    threading.Thread(target=listen, name="cluster-bus", daemon=True).start()
+    loop.add_signal_handler(signal.SIGTERM, lambda: loop.create_task(main.bot.close()))
+    async with main.bot:
+        await main.bot.start(main.DISCORD_TOKEN)
+
+# ====== الأب: تشغيل العمّال وتوزيع الأحداث ======
+class Cluster:
+    def __init__(self, shard_count: int, clusters: int, max_concurrency: int = 1):
+        self.ctx = multiprocessing.get_context("spawn")
+        self.shard_count = shard_count
+        self.ranges = shard_ranges(shard_count, clusters)
+        self.max_concurrency = max(1, max_concurrency)
+        self.outbox = self.ctx.Queue()
+        self.inboxes = [self.ctx.Queue() for _ in self.ranges]
+        self.procs = [None] * len(self.ranges)
+        self.started = [0.0] * len(self.ranges)
+        self.stopping = False
+
+    def spawn(self, index: int):
+        p = self.ctx.Process(
+            target=_worker, name=f"cluster-{index}",
+            args=(index, self.ranges[index], self.shard_count, self.inboxes[index], self.outbox),
+        )
+        p.start()
+        self.procs[index] = p
+        self.started[index] = time.monotonic()
+        print(f"🚀 cluster {index}: shards {self.ranges[index][0]}-{self.ranges[index][-1]} (pid {p.pid})")
+
+    def start(self):
+        for i in range(len(self.ranges)):
+            self.spawn(i)
+            # نوزّع الـ identify بين العمليات بدل أن تتزاحم على نفس الحد
+            if i + 1 < len(self.ranges):
+                time.sleep(len(self.ranges[i]) * IDENTIFY_SECONDS / self.max_concurrency)
+
+    def relay(self):
+        next_check = 0.0
+        while not self.stopping:
+            try:
+                sender, event = self.outbox.get(timeout=1.0)
+                for i, inbox in enumerate(self.inboxes):
+                    if i != sender:
+                        inbox.put(event)
+            except queue.Empty:
+                pass
+            if time.monotonic() >= next_check:
+                self.check()
+                next_check = time.monotonic() + 1.0
+
+    def check(self):
+        for i, p in enumerate(self.procs):
+            if p is not None and not p.is_alive() and not self.stopping:
+                print(f"⚠️ cluster {i} exited with code {p.exitcode}, restarting")
+                # العملية الجديدة تبدأ بكاش فارغ، فالأحداث القديمة في طابورها لا داعي لها
+                self._clear(self.inboxes[i])
+                if time.monotonic() - self.started[i] < RESTART_BACKOFF:
+                    time.sleep(RESTART_BACKOFF)
+                self.spawn(i)
+
+    @staticmethod
+    def _clear(q):
+        try:
+            while True:
+                q.get_nowait()
+        except queue.Empty:
+            pass
+
+    def stop(self):
+        self.stopping = True
+        for inbox in self.inboxes:
+            inbox.put(None)
+        for p in self.procs:
+            if p is not None and p.is_alive():
+                p.terminate()  # SIGTERM → bot.close() يفرّغ الحصص ويغلق القاعدة
+        for p in self.procs:
+            if p is not None:
+                p.join(30)
+
+def main_cli():
+    token = os.getenv("DISCORD_TOKEN", "")
+    if not token:
+        raise RuntimeError("DISCORD_TOKEN missing in .env")
+
+    shard_count, max_concurrency = SHARD_COUNT, 1
+    if shard_count <= 0:
+        shard_count, max_concurrency = asyncio.run(_recommended_shards(token))
+
+    cluster = Cluster(shard_count, CLUSTERS, max_concurrency)
+    try:
+        cluster.start()
+        cluster.relay()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        cluster.stop()
+
+if __name__ == "__main__":
+    main_cli()
@@ -1,27 +1,140 @@
+import asyncio
+import heapq
+import os
+import re
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
 import aiosqlite
-import sqlite3
+
+from metrics import METRICS_ENABLED, histogram, inc, gauge
 
 DB_PATH = "bot.db"
+DB_READERS = int(os.getenv("DB_READERS", "4"))
+GUILD_CACHE_SIZE = int(os.getenv("GUILD_CACHE_SIZE", "2000"))
+USAGE_FLUSH_SECONDS = float(os.getenv("USAGE_FLUSH_SECONDS", "1.0"))
 
-async def init_db():
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("""
+# ====== مجمّع الاتصالات (كاتب واحد + عدة قرّاء) ======
+_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-8000",
+    "PRAGMA mmap_size=67108864",
+)
+
+_writer = None
+_readers = []
+_idle_readers = None
+_write_lock = asyncio.Lock()
+_pool_lock = asyncio.Lock()
+_tracer = None
+
+async def _connect(readonly: bool = False):
+    # cached_statements: sqlite3 يعيد استخدام الـ prepared statements لنفس نص الاستعلام
+    conn = await aiosqlite.connect(DB_PATH, cached_statements=256)
+    for pragma in _PRAGMAS:
+        await conn.execute(pragma)
+    if readonly:
+        await conn.execute("PRAGMA query_only=1")
+    if _tracer is not None:
+        await conn.set_trace_callback(_tracer)
+    return conn
+
+async def set_query_tracer(callback):
+    # sqlite3 trace callback على كل اتصالات المجمّع (None لإزالته) — للقياس فقط
+    global _tracer
+    _tracer = callback
+    for conn in ([_writer] if _writer is not None else []) + _readers:
+        await conn.set_trace_callback(callback)
+
+async def open_db():
+    global _writer, _idle_readers
+    async with _pool_lock:
+        if _writer is not None:
+            return
+        writer = await _connect()  # الكاتب أولاً حتى يتفعّل WAL قبل القرّاء
+        idle = asyncio.Queue()
+        for _ in range(max(1, DB_READERS)):
+            conn = await _connect(readonly=True)
+            _readers.append(conn)
+            idle.put_nowait(conn)
+        _writer, _idle_readers = writer, idle
+
+async def close_db():
+    global _writer, _idle_readers
+    if _usage_timer is not None:
+        _usage_timer.cancel()
+    if _writer is not None:
+        await flush_daily_usage()
+    async with _pool_lock:
+        if _writer is None:
+            return
+        async with _write_lock:
+            await _writer.close()
+        for conn in _readers:
+            await conn.close()
+        _readers.clear()
+        _writer, _idle_readers = None, None
+
+_read_seconds = histogram("db_seconds", kind="read") if METRICS_ENABLED else None
+_write_seconds = histogram("db_seconds", kind="write") if METRICS_ENABLED else None
+
+@asynccontextmanager
+async def _read():
+    if _writer is None:
+        await open_db()
+    pool = _idle_readers
+    conn = await pool.get()
+    start = time.perf_counter() if METRICS_ENABLED else 0.0
+    try:
+        yield conn
+    finally:
+        pool.put_nowait(conn)
+        if METRICS_ENABLED:
+            _read_seconds.observe(time.perf_counter() - start)
+
+@asynccontextmanager
+async def _write():
+    if _writer is None:
+        await open_db()
+    async with _write_lock:
+        start = time.perf_counter() if METRICS_ENABLED else 0.0
+        try:
+            yield _writer
+        except BaseException:
+            await _writer.rollback()
+            raise
+        await _writer.commit()
+        if METRICS_ENABLED:
+            _write_seconds.observe(time.perf_counter() - start)
+
+# ====== المخطط (migrations بإصدارات) ======
+# كل عنصر = إصدار واحد يُطبّق مرة واحدة ويُسجّل في PRAGMA user_version.
+# الإصدار 1 هو المخطط الأصلي بـ IF NOT EXISTS، فقواعد البيانات القديمة (user_version=0) تمر عليه بأمان.
+# لا تعدّل إصداراً منشوراً: أضف إصداراً جديداً في آخر القائمة.
+_MIGRATIONS = (
+    (
+        """
         CREATE TABLE IF NOT EXISTS guild_config (
             guild_id INTEGER PRIMARY KEY,
             assistant_channel_id INTEGER
         )
-        """)
-        await db.execute("""
+        """,
+        """
         CREATE TABLE IF NOT EXISTS daily_usage (
             guild_id INTEGER NOT NULL,
             day TEXT NOT NULL,
             count INTEGER NOT NULL DEFAULT 0,
             PRIMARY KEY (guild_id, day)
         )
-        """)
-
+        """,
         # حماية السيرفر
-        await db.execute("""
+        """
         CREATE TABLE IF NOT EXISTS guild_protection (
             guild_id INTEGER PRIMARY KEY,
             log_channel_id INTEGER,
@@ -36,96 +149,272 @@ async def init_db():
             timeout_seconds INTEGER NOT NULL DEFAULT 60,
             roles_enabled INTEGER NOT NULL DEFAULT 0         -- Premium enforcement
         )
-        """)
-
-        await db.execute("""
+        """,
+        """
         CREATE TABLE IF NOT EXISTS banned_words (
             guild_id INTEGER NOT NULL,
             word TEXT NOT NULL,
             PRIMARY KEY (guild_id, word)
         )
-        """)
-
-        await db.execute("""
+        """,
+        """
         CREATE TABLE IF NOT EXISTS allowed_domains (
             guild_id INTEGER NOT NULL,
             domain TEXT NOT NULL,
             PRIMARY KEY (guild_id, domain)
         )
-        """)
-
-        await db.execute("""
+        """,
+        """
         CREATE TABLE IF NOT EXISTS bypass_roles (
             guild_id INTEGER NOT NULL,
             role_id INTEGER NOT NULL,
             PRIMARY KEY (guild_id, role_id)
         )
-        """)
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS premium_guilds (
+            guild_id INTEGER PRIMARY KEY,
+            expires_at TEXT
+        )
+        """,
+    ),
+    (
+        # كاش أجوبة المساعد (المفتاح = hash للسؤال بعد التطبيع + الموديل + نطاق السيرفر)
+        """
+        CREATE TABLE IF NOT EXISTS answer_cache (
+            key TEXT PRIMARY KEY,
+            guild_id INTEGER NOT NULL,
+            model TEXT NOT NULL,
+            answer TEXT NOT NULL,
+            created_at REAL NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS answer_cache_created ON answer_cache (created_at)",
+    ),
+    (
+        # قيم داخلية للبوت (مثل hash شجرة الأوامر آخر مزامنة)
+        """
+        CREATE TABLE IF NOT EXISTS bot_meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        )
+        """,
+    ),
+    (
+        # ذاكرة محادثات /ask: صف واحد لكل محادثة (user_id=0 = مشتركة للقناة)، الأدوار JSON [[سؤال، جواب], ...]
+        """
+        CREATE TABLE IF NOT EXISTS conversations (
+            guild_id INTEGER NOT NULL,
+            channel_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            summary TEXT NOT NULL DEFAULT '',
+            turns TEXT NOT NULL DEFAULT '[]',
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (guild_id, channel_id, user_id)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS conversations_updated ON conversations (updated_at)",
+    ),
+)
 
-        await db.commit()
+async def init_db() -> int:
+    """Apply pending migrations; returns how many versions were applied."""
+    await open_db()
+    async with _write() as db:
+        # BEGIN IMMEDIATE: لو بدأت عدة عمليات (cluster.py) معاً تنتظر إحداها الأخرى بدل تكرار الترحيل
+        await db.execute("BEGIN IMMEDIATE")
+        rows = await db.execute_fetchall("PRAGMA user_version")
+        version = rows[0][0]
+        for statements in _MIGRATIONS[version:]:
+            for sql in statements:
+                await db.execute(sql)
+        if version < len(_MIGRATIONS):
+            await db.execute(f"PRAGMA user_version={len(_MIGRATIONS)}")
+    return max(len(_MIGRATIONS) - version, 0)
+
+async def get_meta(key: str):
+    async with _read() as db:
+        rows = await db.execute_fetchall("SELECT value FROM bot_meta WHERE key=?", (key,))
+        return rows[0][0] if rows else None
+
+async def set_meta(key: str, value: str):
+    async with _write() as db:
+        await db.execute(
+            "INSERT INTO bot_meta (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value=excluded.value",
+            (key, value)
+        )
 
 # ====== مساعد AI ======
 async def set_assistant_channel(guild_id: int, channel_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _write() as db:
         await db.execute("""
         INSERT INTO guild_config (guild_id, assistant_channel_id)
         VALUES (?, ?)
         ON CONFLICT(guild_id) DO UPDATE SET assistant_channel_id=excluded.assistant_channel_id
         """, (guild_id, channel_id))
-        await db.commit()
 
 async def get_assistant_channel(guild_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
-        cur = await db.execute(
+    async with _read() as db:
+        rows = await db.execute_fetchall(
             "SELECT assistant_channel_id FROM guild_config WHERE guild_id=?",
             (guild_id,)
         )
-        row = await cur.fetchone()
-        return row[0] if row else None
+        return rows[0][0] if rows else None
 
-async def get_daily_usage(guild_id: int, day: str) -> int:
-    async with aiosqlite.connect(DB_PATH) as db:
-        cur = await db.execute(
+async def _read_daily_usage(guild_id: int, day: str) -> int:
+    async with _read() as db:
+        rows = await db.execute_fetchall(
             "SELECT count FROM daily_usage WHERE guild_id=? AND day=?",
             (guild_id, day)
         )
-        row = await cur.fetchone()
-        return int(row[0]) if row else 0
+        return int(rows[0][0]) if rows else 0
 
-async def increment_daily_usage(guild_id: int, day: str) -> int:
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("BEGIN IMMEDIATE")
-        try:
-            await db.execute(
-                "INSERT INTO daily_usage (guild_id, day, count) VALUES (?, ?, 1)",
-                (guild_id, day)
-            )
-        except sqlite3.IntegrityError:
-            await db.execute(
-                "UPDATE daily_usage SET count = count + 1 WHERE guild_id=? AND day=?",
-                (guild_id, day)
-            )
-
-        cur = await db.execute(
-            "SELECT count FROM daily_usage WHERE guild_id=? AND day=?",
-            (guild_id, day)
+# ====== عدّاد الاستخدام اليومي (في الذاكرة + كتابة مؤجلة) ======
+# العدّاد يُحجز في الذاكرة فوراً، ويُكتب لقاعدة البيانات على دفعات كل USAGE_FLUSH_SECONDS.
+# من يحجز سؤالاً ينتظر usage_persisted() قبل إرسال الجواب، فلو توقف البوت قبل الكتابة
+# لن يكون المستخدم قد حصل على جواب لم يُحسب عليه.
+_usage = {}
+_usage_loads = {}
+_usage_dirty = {}
+_usage_done = None
+_usage_timer = None
+
+async def get_daily_usage(guild_id: int, day: str) -> int:
+    key = (guild_id, day)
+    if key in _usage:
+        return _usage[key]
+    task = _usage_loads.get(key)
+    if task is None:
+        task = _usage_loads[key] = asyncio.ensure_future(_load_daily_usage(key))
+    return await asyncio.shield(task)
+
+async def _load_daily_usage(key) -> int:
+    try:
+        count = await _read_daily_usage(*key)
+        return _usage.setdefault(key, count)
+    finally:
+        _usage_loads.pop(key, None)
+
+async def reserve_daily_usage(guild_id: int, day: str, limit: int):
+    await get_daily_usage(guild_id, day)
+    key = (guild_id, day)
+    count = _usage[key]
+    if count >= limit:
+        return None
+    _usage[key] = _usage_dirty[key] = count + 1
+    _schedule_usage_flush()
+    return count + 1
+
+def usage_persisted():
+    global _usage_done
+    if _usage_done is None:
+        _usage_done = asyncio.get_running_loop().create_future()
+        _usage_done.add_done_callback(lambda f: f.cancelled() or f.exception())
+    return _usage_done
+
+def _schedule_usage_flush():
+    global _usage_timer
+    usage_persisted()
+    if _usage_timer is None:
+        _usage_timer = asyncio.ensure_future(_flush_usage_later())
+
+async def _flush_usage_later():
+    global _usage_timer
+    try:
+        await asyncio.sleep(USAGE_FLUSH_SECONDS)
+        await flush_daily_usage()
+    except Exception as e:
+        print("Usage flush error:", e)
+    finally:
+        _usage_timer = None
+        if _usage_dirty:
+            _schedule_usage_flush()
+
+async def flush_daily_usage():
+    global _usage_done
+    if not _usage_dirty:
+        return
+    batch = dict(_usage_dirty)
+    _usage_dirty.clear()
+    done, _usage_done = _usage_done, None
+    try:
+        async with _write() as db:
+            await db.executemany("""
+            INSERT INTO daily_usage (guild_id, day, count) VALUES (?, ?, ?)
+            ON CONFLICT(guild_id, day) DO UPDATE SET count=MAX(count, excluded.count)
+            """, [(g, d, c) for (g, d), c in batch.items()])
+    except BaseException as e:
+        for key, count in batch.items():
+            _usage_dirty[key] = max(count, _usage_dirty.get(key, 0))
+        if done is not None and not done.done():
+            if isinstance(e, Exception):
+                done.set_exception(e)
+            else:
+                done.cancel()
+        raise
+    if done is not None and not done.done():
+        done.set_result(None)
+
+    # نحتفظ في الذاكرة بآخر يوم فقط
+    latest = max(d for _, d in _usage)
+    for key in [k for k in _usage if k[1] < latest and k not in _usage_dirty]:
+        del _usage[key]
+
+# ====== كاش أجوبة المساعد ======
+async def get_cached_answer(key: str):
+    async with _read() as db:
+        rows = await db.execute_fetchall("SELECT answer, created_at FROM answer_cache WHERE key=?", (key,))
+        return (rows[0][0], float(rows[0][1])) if rows else None
+
+async def put_cached_answer(key: str, guild_id: int, model: str, answer: str, created_at: float):
+    async with _write() as db:
+        await db.execute("""
+        INSERT INTO answer_cache (key, guild_id, model, answer, created_at) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(key) DO UPDATE SET answer=excluded.answer, created_at=excluded.created_at
+        """, (key, guild_id, model, answer, created_at))
+
+async def purge_answer_cache(before: float):
+    async with _write() as db:
+        await db.execute("DELETE FROM answer_cache WHERE created_at < ?", (before,))
+
+async def get_conversation(guild_id: int, channel_id: int, user_id: int):
+    async with _read() as db:
+        rows = await db.execute_fetchall(
+            "SELECT summary, turns, updated_at FROM conversations WHERE guild_id=? AND channel_id=? AND user_id=?",
+            (guild_id, channel_id, user_id)
         )
-        row = await cur.fetchone()
-        await db.commit()
-        return int(row[0]) if row else 0
+        return (rows[0][0], rows[0][1], float(rows[0][2])) if rows else None
+
+async def save_conversation(guild_id: int, channel_id: int, user_id: int, summary: str, turns: str, updated_at: float):
+    async with _write() as db:
+        await db.execute("""
+        INSERT INTO conversations (guild_id, channel_id, user_id, summary, turns, updated_at) VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(guild_id, channel_id, user_id) DO UPDATE SET
+            summary=excluded.summary, turns=excluded.turns, updated_at=excluded.updated_at
+        """, (guild_id, channel_id, user_id, summary, turns, updated_at))
+
+async def delete_conversation(guild_id: int, channel_id: int, user_id: int):
+    async with _write() as db:
+        await db.execute(
+            "DELETE FROM conversations WHERE guild_id=? AND channel_id=? AND user_id=?",
+            (guild_id, channel_id, user_id)
+        )
+
+async def purge_conversations(before: float):
+    async with _write() as db:
+        await db.execute("DELETE FROM conversations WHERE updated_at < ?", (before,))
 
 # ====== حماية السيرفر ======
 async def ensure_protection_row(guild_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _write() as db:
         await db.execute("INSERT OR IGNORE INTO guild_protection (guild_id) VALUES (?)", (guild_id,))
-        await db.commit()
 
 async def get_protection_config(guild_id: int) -> dict:
     await ensure_protection_row(guild_id)
-    async with aiosqlite.connect(DB_PATH) as db:
-        cur = await db.execute("SELECT * FROM guild_protection WHERE guild_id=?", (guild_id,))
-        row = await cur.fetchone()
-        cols = [d[0] for d in cur.description]
+    async with _read() as db:
+        async with db.execute("SELECT * FROM guild_protection WHERE guild_id=?", (guild_id,)) as cur:
+            row = await cur.fetchone()
+            cols = [d[0] for d in cur.description]
         return dict(zip(cols, row)) if row else {}
 
 async def update_protection_config(guild_id: int, **fields):
@@ -135,61 +424,351 @@ async def update_protection_config(guild_id: int, **fields):
     keys = list(fields.keys())
     values = [fields[k] for k in keys]
     set_sql = ", ".join([f"{k}=?" for k in keys])
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _write() as db:
         await db.execute(f"UPDATE guild_protection SET {set_sql} WHERE guild_id=?", (*values, guild_id))
-        await db.commit()
+    _cache_edit(guild_id, "config", lambda c: {**c, **fields})
 
 async def list_banned_words(guild_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
-        cur = await db.execute("SELECT word FROM banned_words WHERE guild_id=? ORDER BY word", (guild_id,))
-        return [r[0] for r in await cur.fetchall()]
+    async with _read() as db:
+        rows = await db.execute_fetchall("SELECT word FROM banned_words WHERE guild_id=? ORDER BY word", (guild_id,))
+        return [r[0] for r in rows]
 
 async def add_banned_word(guild_id: int, word: str):
-    w = word.strip().lower()
-    if not w:
-        return
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("INSERT OR IGNORE INTO banned_words (guild_id, word) VALUES (?, ?)", (guild_id, w))
-        await db.commit()
+    await add_banned_words(guild_id, [word])
 
 async def remove_banned_word(guild_id: int, word: str):
-    w = word.strip().lower()
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("DELETE FROM banned_words WHERE guild_id=? AND word=?", (guild_id, w))
-        await db.commit()
+    await remove_banned_words(guild_id, [word])
+
+async def add_banned_words(guild_id: int, words, replace: bool = False) -> int:
+    return await _bulk_add(guild_id, "words", words, replace)
+
+async def remove_banned_words(guild_id: int, words) -> int:
+    return await _bulk_remove(guild_id, "words", words)
 
 async def list_allowed_domains(guild_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
-        cur = await db.execute("SELECT domain FROM allowed_domains WHERE guild_id=? ORDER BY domain", (guild_id,))
-        return [r[0] for r in await cur.fetchall()]
+    async with _read() as db:
+        rows = await db.execute_fetchall("SELECT domain FROM allowed_domains WHERE guild_id=? ORDER BY domain", (guild_id,))
+        return [r[0] for r in rows]
+
+# labels من حروف/أرقام وشرطات (بدون مسافات أو ترقيم)، تقبل الدومينات الدولية
+_HOSTNAME = re.compile(r"(?=.{1,253}$)(?:[^\W_](?:(?:[^\W_]|-){0,61}[^\W_])?\.)*[^\W_](?:(?:[^\W_]|-){0,61}[^\W_])?")
+
+def normalize_domain(domain: str) -> str:
+    d = domain.strip().lower()
+    try:
+        host = urlsplit(d if "://" in d else "//" + d).hostname or ""
+    except ValueError:
+        return ""
+    host = host.rstrip(".")
+    if not _HOSTNAME.fullmatch(host):
+        return ""
+    return host[4:] if host.startswith("www.") else host
 
 async def add_allowed_domain(guild_id: int, domain: str):
-    d = domain.strip().lower().replace("https://", "").replace("http://", "")
-    d = d.split("/")[0].replace("www.", "")
-    if not d:
-        return
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("INSERT OR IGNORE INTO allowed_domains (guild_id, domain) VALUES (?, ?)", (guild_id, d))
-        await db.commit()
+    await add_allowed_domains(guild_id, [domain])
 
 async def remove_allowed_domain(guild_id: int, domain: str):
-    d = domain.strip().lower().replace("https://", "").replace("http://", "")
-    d = d.split("/")[0].replace("www.", "")
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("DELETE FROM allowed_domains WHERE guild_id=? AND domain=?", (guild_id, d))
-        await db.commit()
+    await remove_allowed_domains(guild_id, [domain])
+
+async def add_allowed_domains(guild_id: int, domains, replace: bool = False) -> int:
+    return await _bulk_add(guild_id, "domains", domains, replace)
+
+async def remove_allowed_domains(guild_id: int, domains) -> int:
+    return await _bulk_remove(guild_id, "domains", domains)
 
 async def list_bypass_roles(guild_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
-        cur = await db.execute("SELECT role_id FROM bypass_roles WHERE guild_id=? ORDER BY role_id", (guild_id,))
-        return [int(r[0]) for r in await cur.fetchall()]
+    async with _read() as db:
+        rows = await db.execute_fetchall("SELECT role_id FROM bypass_roles WHERE guild_id=? ORDER BY role_id", (guild_id,))
+        return [int(r[0]) for r in rows]
 
 async def add_bypass_role(guild_id: int, role_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("INSERT OR IGNORE INTO bypass_roles (guild_id, role_id) VALUES (?, ?)", (guild_id, role_id))
-        await db.commit()
+    await add_bypass_roles(guild_id, [role_id])
 
 async def remove_bypass_role(guild_id: int, role_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("DELETE FROM bypass_roles WHERE guild_id=? AND role_id=?", (guild_id, role_id))
-        await db.commit()
+    await remove_bypass_roles(guild_id, [role_id])
+
+async def add_bypass_roles(guild_id: int, role_ids, replace: bool = False) -> int:
+    return await _bulk_add(guild_id, "bypass", role_ids, replace)
+
+async def remove_bypass_roles(guild_id: int, role_ids) -> int:
+    return await _bulk_remove(guild_id, "bypass", role_ids)
+
+# ====== تعديل القوائم دفعة واحدة ======
+# أي عدد من العناصر = transaction واحدة بـ executemany، ثم تعديل واحد للقطة السيرفر
+# (فيُبنى الـ matcher / الـ allowlist مرة واحدة بعد الاستيراد وليس لكل عنصر).
+def _normalize_word(word: str) -> str:
+    return word.strip().lower()
+
+def _normalize_role(role_id) -> int:
+    try:
+        return int(str(role_id).strip())
+    except ValueError:
+        return 0
+
+_LISTS = {
+    # مفتاح اللقطة -> (الجدول، العمود، التطبيع)
+    "words": ("banned_words", "word", _normalize_word),
+    "domains": ("allowed_domains", "domain", normalize_domain),
+    "bypass": ("bypass_roles", "role_id", _normalize_role),
+}
+
+def _clean(key: str, values) -> list:
+    normalize = _LISTS[key][2]
+    return list(dict.fromkeys(v for v in map(normalize, values) if v))
+
+async def _bulk_add(guild_id: int, key: str, values, replace: bool = False) -> int:
+    table, column, _ = _LISTS[key]
+    items = _clean(key, values)
+    if not items and not replace:
+        return 0
+    async with _write() as db:
+        if replace:
+            await db.execute(f"DELETE FROM {table} WHERE guild_id=?", (guild_id,))
+        before = db.total_changes
+        await db.executemany(
+            f"INSERT OR IGNORE INTO {table} (guild_id, {column}) VALUES (?, ?)", [(guild_id, v) for v in items]
+        )
+        added = db.total_changes - before
+    new = frozenset(items)
+    _cache_edit(guild_id, key, (lambda s: new) if replace else (lambda s: s | new))
+    return added
+
+async def _bulk_remove(guild_id: int, key: str, values) -> int:
+    table, column, _ = _LISTS[key]
+    items = _clean(key, values)
+    if not items:
+        return 0
+    async with _write() as db:
+        before = db.total_changes
+        await db.executemany(
+            f"DELETE FROM {table} WHERE guild_id=? AND {column}=?", [(guild_id, v) for v in items]
+        )
+        removed = db.total_changes - before
+    gone = frozenset(items)
+    _cache_edit(guild_id, key, lambda s: s - gone)
+    return removed
+
+# ====== كاش الحماية في الذاكرة (لكل سيرفر) ======
+# snapshot = {"config": dict, "words": frozenset, "domains": frozenset, "bypass": frozenset}
+# اللقطات لا تتغير: أي تعديل يبني لقطة جديدة، فمن يحمل نسخة قديمة لا يتأثر.
+_guild_cache: "OrderedDict[int, dict]" = OrderedDict()
+_guild_loads: dict = {}
+
+async def get_guild_snapshot(guild_id: int) -> dict:
+    snap = _guild_cache.get(guild_id)
+    if snap is not None:
+        _guild_cache.move_to_end(guild_id)
+        if METRICS_ENABLED:
+            inc("guild_cache_total", result="hit")
+        return snap
+    if METRICS_ENABLED:
+        inc("guild_cache_total", result="miss")
+    task = _guild_loads.get(guild_id)
+    if task is None:
+        task = asyncio.ensure_future(_load_guild_snapshot(guild_id))
+        _guild_loads[guild_id] = task
+    return await asyncio.shield(task)
+
+async def _load_guild_snapshot(guild_id: int) -> dict:
+    me = asyncio.current_task()
+    try:
+        snap = {
+            "config": await get_protection_config(guild_id),
+            "words": frozenset(await list_banned_words(guild_id)),
+            "domains": frozenset(await list_allowed_domains(guild_id)),
+            "bypass": frozenset(await list_bypass_roles(guild_id)),
+        }
+        # لو تم تعديل/إلغاء السيرفر أثناء التحميل لا نخزّن نسخة قديمة
+        if _guild_loads.get(guild_id) is me:
+            _cache_put(guild_id, snap)
+        return snap
+    finally:
+        if _guild_loads.get(guild_id) is me:
+            del _guild_loads[guild_id]
+
+async def warm_guild_cache(guild_ids, chunk: int = 500) -> int:
+    # تحميل لقطات عدة سيرفرات دفعة واحدة: كتابة واحدة (الصفوف الافتراضية) + 4 استعلامات IN لكل دفعة
+    # بدل 5 استعلامات لكل سيرفر. الدفعات تعمل بالتوازي على القرّاء. ترجع عدد اللقطات المحمّلة.
+    todo = [g for g in dict.fromkeys(guild_ids) if g not in _guild_cache and g not in _guild_loads]
+    todo = todo[:GUILD_CACHE_SIZE]
+    chunks = [todo[i:i + chunk] for i in range(0, len(todo), chunk)]
+    slots = asyncio.Semaphore(max(1, DB_READERS))
+
+    async def load(ids):
+        async with slots:
+            return await _load_guild_snapshots(ids)
+
+    done = await asyncio.gather(*(load(ids) for ids in chunks))
+    return sum(done)
+
+async def _load_guild_snapshots(guild_ids: list) -> int:
+    loop = asyncio.get_running_loop()
+    # نسجّل future لكل سيرفر حتى ينتظره get_guild_snapshot بدل تحميل مكرر، ويُلغى لو عُدّل أثناء التحميل
+    futs = {}
+    for gid in guild_ids:
+        if gid not in _guild_cache and gid not in _guild_loads:
+            futs[gid] = _guild_loads[gid] = loop.create_future()
+    if not futs:
+        return 0
+    ids = list(futs)
+    marks = ",".join("?" * len(ids))
+    try:
+        async with _write() as db:
+            await db.executemany("INSERT OR IGNORE INTO guild_protection (guild_id) VALUES (?)", [(g,) for g in ids])
+        snaps = {g: {"config": {}, "words": [], "domains": [], "bypass": []} for g in ids}
+        async with _read() as db:
+            async with db.execute(f"SELECT * FROM guild_protection WHERE guild_id IN ({marks})", ids) as cur:
+                cols = [d[0] for d in cur.description]
+                for row in await cur.fetchall():
+                    snaps[row[0]]["config"] = dict(zip(cols, row))
+            for key, sql in (
+                ("words", "SELECT guild_id, word FROM banned_words"),
+                ("domains", "SELECT guild_id, domain FROM allowed_domains"),
+                ("bypass", "SELECT guild_id, role_id FROM bypass_roles"),
+            ):
+                for gid, value in await db.execute_fetchall(f"{sql} WHERE guild_id IN ({marks})", ids):
+                    snaps[gid][key].append(int(value) if key == "bypass" else value)
+    except BaseException as e:
+        for gid, fut in futs.items():
+            if _guild_loads.get(gid) is fut:
+                del _guild_loads[gid]
+            if isinstance(e, Exception):
+                fut.set_exception(e)
+                fut.add_done_callback(lambda f: f.exception())
+            else:
+                fut.cancel()
+        raise
+
+    loaded = 0
+    for gid, fut in futs.items():
+        raw = snaps[gid]
+        snap = {
+            "config": raw["config"],
+            "words": frozenset(raw["words"]),
+            "domains": frozenset(raw["domains"]),
+            "bypass": frozenset(raw["bypass"]),
+        }
+        if _guild_loads.get(gid) is fut:
+            del _guild_loads[gid]
+            _cache_put(gid, snap)
+            loaded += 1
+        fut.set_result(snap)
+    return loaded
+
+def _cache_put(guild_id: int, snap: dict):
+    _guild_cache[guild_id] = snap
+    _guild_cache.move_to_end(guild_id)
+    while len(_guild_cache) > GUILD_CACHE_SIZE:
+        _guild_cache.popitem(last=False)
+
+def _cache_edit(guild_id: int, key: str, fn):
+    _guild_loads.pop(guild_id, None)
+    snap = _guild_cache.get(guild_id)
+    if snap is not None:
+        _guild_cache[guild_id] = {**snap, key: fn(snap[key])}
+    _publish("guild", guild_id)
+
+gauge("guild_cache_entries", lambda: len(_guild_cache))
+
+def invalidate_guild_cache(guild_id: int):
+    _drop_guild(guild_id)
+    _publish("guild", guild_id)
+
+def _drop_guild(guild_id: int):
+    _guild_loads.pop(guild_id, None)
+    _guild_cache.pop(guild_id, None)
+
+# ====== إبطال الكاش بين العمليات (cluster.py) ======
+# في وضع التشغيل الموزّع كل عملية تملك كاشها؛ أي تعديل محلي يُنشر للباقي عبر الـ publisher،
+# والأحداث القادمة تُطبّق بـ apply_cache_event بدون إعادة نشر.
+_publisher = None
+
+def set_cache_publisher(fn):
+    global _publisher
+    _publisher = fn
+
+def _publish(*event):
+    if _publisher is not None:
+        _publisher(event)
+
+def apply_cache_event(event: tuple):
+    kind = event[0]
+    if kind == "guild":
+        _drop_guild(event[1])
+    elif kind == "premium":
+        _remember_premium(event[1], event[2])
+
+# ====== سجل Premium في الذاكرة ======
+# يُحمّل جدول premium_guilds مرة واحدة عند التشغيل ويُدمج مع PREMIUM_GUILDS من .env.
+# is_premium_guild فحص dict فقط؛ الانتهاء يُدار بـ heap ومؤقّت واحد على أقرب موعد.
+_premium = {}       # guild_id -> expires_at (epoch) أو None = دائم
+_premium_env = frozenset()
+_premium_expiry = []  # heap of (expires_at, guild_id)
+_premium_timer = None
+
+def _parse_expiry(value):
+    if not value:
+        return None
+    dt = datetime.fromisoformat(value)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+def is_premium_guild(guild_id: int) -> bool:
+    if guild_id in _premium_env:
+        return True
+    if guild_id not in _premium:
+        return False
+    expires = _premium[guild_id]
+    return expires is None or expires > time.time()
+
+async def load_premium_guilds(env_guilds=()):
+    global _premium_env
+    _premium_env = frozenset(env_guilds)
+    async with _read() as db:
+        rows = await db.execute_fetchall("SELECT guild_id, expires_at FROM premium_guilds")
+    _premium.clear()
+    _premium_expiry.clear()
+    for guild_id, expires_at in rows:
+        _remember_premium(int(guild_id), _parse_expiry(expires_at))
+
+async def set_premium_guild(guild_id: int, expires_at: datetime = None):
+    value = expires_at.astimezone(timezone.utc).isoformat() if expires_at else None
+    async with _write() as db:
+        await db.execute(
+            "INSERT OR REPLACE INTO premium_guilds (guild_id, expires_at) VALUES (?, ?)",
+            (guild_id, value)
+        )
+    _remember_premium(guild_id, _parse_expiry(value))
+    _publish("premium", guild_id, _parse_expiry(value))
+
+def _remember_premium(guild_id: int, expires):
+    if expires is not None and expires <= time.time():
+        _premium.pop(guild_id, None)
+        return
+    _premium[guild_id] = expires
+    if expires is not None:
+        heapq.heappush(_premium_expiry, (expires, guild_id))
+        _schedule_premium_expiry()
+
+def _schedule_premium_expiry():
+    global _premium_timer
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    if _premium_timer is not None:
+        _premium_timer.cancel()
+        _premium_timer = None
+    if _premium_expiry:
+        delay = max(_premium_expiry[0][0] - time.time(), 0)
+        _premium_timer = loop.call_later(min(delay, 86400), _expire_premium)
+
+def _expire_premium():
+    now = time.time()
+    while _premium_expiry and _premium_expiry[0][0] <= now:
+        expires, guild_id = heapq.heappop(_premium_expiry)
+        # قد يكون السيرفر جدّد بعد دخوله الـ heap، فلا نحذف إلا لو نفس الموعد
+        if _premium.get(guild_id, 0) == expires:
+            del _premium[guild_id]
+    _schedule_premium_expiry()
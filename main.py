@@ -1,44 +1,137 @@
+import asyncio
+import csv
+import hashlib
+import io
+import json
 import os
+import time
 from datetime import datetime, timezone
 
 import discord
 from discord import app_commands
 from discord.ext import commands
 from dotenv import load_dotenv
-from openai import OpenAI
 
+BOOT_AT = time.perf_counter()
+load_dotenv()
+
+from actions import setup_moderation, moderation
+from assistant import (
+    AssistantBusy, ask_stream, cached_answer, answer_cache_info,
+    conversation, remember_turn, forget_conversation
+)
+from metrics import METRICS_ENABLED, gauge, observe, timed, start_metrics, summary_lines
 from db import (
-    init_db, set_assistant_channel, get_assistant_channel,
-    get_daily_usage, increment_daily_usage,
-    get_protection_config, update_protection_config,
-    list_banned_words, add_banned_word, remove_banned_word,
-    list_allowed_domains, add_allowed_domain, remove_allowed_domain,
-    list_bypass_roles, add_bypass_role, remove_bypass_role
+    init_db, close_db, set_assistant_channel, get_assistant_channel,
+    get_daily_usage, reserve_daily_usage, usage_persisted,
+    update_protection_config,
+    list_banned_words, add_banned_word, remove_banned_word, add_banned_words, remove_banned_words,
+    list_allowed_domains, add_allowed_domain, remove_allowed_domain, add_allowed_domains, remove_allowed_domains,
+    list_bypass_roles, add_bypass_role, remove_bypass_role,
+    get_guild_snapshot, invalidate_guild_cache, warm_guild_cache, get_meta, set_meta,
+    load_premium_guilds, set_premium_guild, is_premium_guild
 )
-from protection import handle_message, handle_member_update_roles
-
-load_dotenv()
+from protection import (
+    handle_message, handle_member_update_roles, roles_gained, spam_sweeper,
+    refresh_dangerous_roles, forget_dangerous_roles, drain_role_bursts
+)
+from replies import StreamingReply, split_text
 
 DISCORD_TOKEN = os.getenv("DISCORD_TOKEN", "")
-OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-5.2")
 FREE_DAILY_LIMIT = int(os.getenv("FREE_DAILY_LIMIT", "3"))
 
 premium_raw = os.getenv("PREMIUM_GUILDS", "").strip()
 PREMIUM_GUILDS = {int(x) for x in premium_raw.split(",") if x.strip().isdigit()}
 
-ai = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
 intents = discord.Intents.default()
 intents.guilds = True
 intents.members = True
 intents.message_content = True  # لازم تفعّلها من Developer Portal
 
-bot = commands.Bot(command_prefix="!", intents=intents)
+# وضع cluster.py: كل عملية تملك SHARD_IDS من أصل SHARD_COUNT (فارغ = عملية واحدة عادية)
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "0"))
+SHARD_IDS = [int(x) for x in os.getenv("SHARD_IDS", "").split(",") if x.strip().isdigit()] or None
+CLUSTER_ID = int(os.getenv("CLUSTER_ID", "0"))
+
+# ====== التشغيل ======
+# setup_hook يعمل مرة واحدة لكل عملية (ليس بعد كل reconnect مثل on_ready):
+# الـ migrations هنا، ومزامنة الأوامر فقط لو تغيّر hash شجرة الأوامر، وتسخين الكاش في الخلفية بعد READY.
+startup = {"migrations": 0, "synced": None, "ready": None, "warmed": None, "first_message": None}
+_background = set()  # مراجع لمهام التشغيل في الخلفية حتى لا تُجمع قبل أن تنتهي
+
+def _spawn(coro):
+    task = asyncio.get_running_loop().create_task(coro, name=getattr(coro, "__qualname__", None))
+    _background.add(task)
+    task.add_done_callback(_finished)
+    return task
+
+def _finished(task):
+    _background.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        print(f"⚠️ Background task {task.get_name()} failed: {task.exception()!r}")
+
+class AssistantBot(commands.AutoShardedBot if SHARD_COUNT else commands.Bot):
+    async def setup_hook(self):
+        startup["migrations"] = await init_db()
+        await load_premium_guilds(PREMIUM_GUILDS)
+        setup_moderation(self.http)
+        _spawn(spam_sweeper())
+        await start_metrics(_spawn)
+        if CLUSTER_ID == 0:  # الأوامر عامة: يكفي أن تزامنها عملية واحدة
+            _spawn(sync_commands_if_changed())
+
+    async def close(self):
+        try:
+            if moderation() is not None:
+                await drain_role_bursts()  # دفعات منح الرتب المعلّقة تُحسم قبل إغلاق المنفّذ
+                await moderation().close()
+            await super().close()
+        finally:
+            await close_db()
+
+_shard_kwargs = {"shard_count": SHARD_COUNT, "shard_ids": SHARD_IDS} if SHARD_COUNT else {}
+bot = AssistantBot(command_prefix="!", intents=intents, **_shard_kwargs)
+
+for _phase in ("ready", "warmed", "first_message"):
+    gauge("startup_seconds", lambda p=_phase: startup[p] or 0, phase=_phase)
+gauge("moderation_pending_workers", lambda: moderation().pending() if moderation() else 0)
+
+def command_tree_hash() -> str:
+    payload = sorted((c.to_dict(bot.tree) for c in bot.tree.get_commands()), key=lambda c: (c["type"], c["name"]))
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+async def sync_commands_if_changed():
+    key = f"command_tree_hash:{bot.application_id}"
+    digest = command_tree_hash()
+    try:
+        if await get_meta(key) == digest:
+            startup["synced"] = False
+            return
+        await bot.tree.sync()
+        await set_meta(key, digest)
+        startup["synced"] = True
+        print("✅ Slash commands synced")
+    except Exception as e:
+        print("Sync error:", e)
+
+async def _warm_caches():
+    try:
+        n = await warm_guild_cache([g.id for g in bot.guilds])
+    except Exception as e:
+        print("Cache warm-up error:", e)  # اللقطات تُحمّل عند الطلب كالعادة
+        return
+    startup["warmed"] = time.perf_counter() - BOOT_AT
+    print(f"⏱️ Warmed {n} guild configs in the background ({startup['warmed']:.2f}s since start)")
+
+def _first_message_handled():
+    startup["first_message"] = time.perf_counter() - BOOT_AT
+    print(f"⏱️ Cold start → first handled message: {startup['first_message']:.2f}s")
 
 # ✅ الصق الكود هنا
 @bot.tree.command(name="premium_claim", description="Activate Premium for this server if you own the Premium role in the support server.")
 async def premium_claim(interaction: discord.Interaction):
-    import sqlite3, os
+    if not interaction.guild:
+        return await interaction.response.send_message("Use this in a server.", ephemeral=True)
     support_guild_id = int(os.getenv("SUPPORT_GUILD_ID", "0"))
     premium_role_id = int(os.getenv("PREMIUM_ROLE_ID", "0"))
 
@@ -47,54 +140,85 @@ async def premium_claim(interaction: discord.Interaction):
         return
 
     support_guild = bot.get_guild(support_guild_id)
-    if not support_guild:
-        await interaction.response.send_message("⚠️ Support server not found. Make sure the bot is inside the support server.", ephemeral=True)
-        return
-
-    member = support_guild.get_member(interaction.user.id)
-    premium_role = support_guild.get_role(premium_role_id)
-
-    if not member or not premium_role or premium_role not in member.roles:
+    if support_guild:
+        member = support_guild.get_member(interaction.user.id)
+        has_role = member is not None and any(r.id == premium_role_id for r in member.roles)
+    else:
+        # في وضع cluster قد يكون سيرفر الدعم على shard تملكه عملية أخرى، فنسأل REST
+        try:
+            data = await bot.http.get_member(support_guild_id, interaction.user.id)
+            has_role = str(premium_role_id) in data.get("roles", [])
+        except discord.HTTPException as e:
+            if e.code != 10007:  # 10007 = Unknown Member، أي خطأ آخر = البوت ليس في سيرفر الدعم
+                await interaction.response.send_message("⚠️ Support server not found. Make sure the bot is inside the support server.", ephemeral=True)
+                return
+            has_role = False
+
+    if not has_role:
         await interaction.response.send_message("❌ You don't have the Premium role in the support server.", ephemeral=True)
         return
 
-    with sqlite3.connect("bot.db") as conn:
-        c = conn.cursor()
-        c.execute("CREATE TABLE IF NOT EXISTS premium_guilds (guild_id INTEGER PRIMARY KEY, expires_at TEXT)")
-        c.execute("INSERT OR REPLACE INTO premium_guilds (guild_id, expires_at) VALUES (?, NULL)", (interaction.guild.id,))
-        conn.commit()
+    await set_premium_guild(interaction.guild.id)
 
     await interaction.response.send_message("✅ This server is now marked as **Premium**!", ephemeral=True)
 
 def is_premium(guild_id: int) -> bool:
-    return guild_id in PREMIUM_GUILDS
+    return is_premium_guild(guild_id)
+
+def today_key_utc() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d")
 
 @bot.event
 async def on_ready():
-    await init_db()
-    try:
-        await bot.tree.sync()
-        print(f"✅ Logged in as {bot.user}")
-    except Exception as e:
-        print("Sync error:", e)
+    # يُستدعى أيضاً بعد كل reconnect: لا schema ولا sync هنا
+    if startup["ready"] is not None:
+        return
+    startup["ready"] = time.perf_counter() - BOOT_AT
+    print(f"✅ Logged in as {bot.user} ({startup['ready']:.2f}s, {startup['migrations']} migrations applied)")
+    _spawn(_warm_caches())
 
 
 # ====== حماية: فلترة الرسائل ======
 @bot.event
+@timed("handler_seconds", handler="on_message")
 async def on_message(message: discord.Message):
     if message.guild:
-        cfg = await get_protection_config(message.guild.id)
-        words = await list_banned_words(message.guild.id) if int(cfg.get("words_enabled") or 0) == 1 else []
-        domains = await list_allowed_domains(message.guild.id) if (cfg.get("links_mode") == "all") else []
+        snap = await get_guild_snapshot(message.guild.id)
+        cfg = snap["config"]
+        words = snap["words"] if int(cfg.get("words_enabled") or 0) == 1 else frozenset()
+        domains = snap["domains"] if (cfg.get("links_mode") == "all") else frozenset()
         await handle_message(message, cfg, words, domains, is_premium(message.guild.id))
+        if startup["first_message"] is None:
+            _first_message_handled()
     await bot.process_commands(message)
 
 # ====== حماية: توزيع الرتب الخطير ======
 @bot.event
+@timed("handler_seconds", handler="on_member_update")
 async def on_member_update(before: discord.Member, after: discord.Member):
-    cfg = await get_protection_config(after.guild.id)
-    bypass = await list_bypass_roles(after.guild.id)
-    await handle_member_update_roles(before, after, cfg, bypass, is_premium(after.guild.id))
+    gained = roles_gained(before, after)
+    if not gained:
+        return  # nickname / avatar / ...: بدون SQL ولا لقطة
+    snap = await get_guild_snapshot(after.guild.id)
+    await handle_member_update_roles(before, after, snap["config"], snap["bypass"], is_premium(after.guild.id), gained)
+
+@bot.event
+async def on_guild_role_create(role: discord.Role):
+    refresh_dangerous_roles(role.guild)
+
+@bot.event
+async def on_guild_role_delete(role: discord.Role):
+    refresh_dangerous_roles(role.guild)
+
+@bot.event
+async def on_guild_role_update(before: discord.Role, after: discord.Role):
+    if before.permissions != after.permissions:
+        refresh_dangerous_roles(after.guild)
+
+@bot.event
+async def on_guild_remove(guild: discord.Guild):
+    invalidate_guild_cache(guild.id)
+    forget_dangerous_roles(guild.id)
 
 # ====== أوامر المساعد AI ======
 @bot.tree.command(name="setchannel", description="Set the assistant channel for this server")
@@ -122,6 +246,7 @@ async def usage(interaction: discord.Interaction):
     )
 
 @bot.tree.command(name="ask", description="Ask the assistant (only works in the configured channel)")
+@timed("handler_seconds", handler="ask")
 async def ask(interaction: discord.Interaction, question: str):
     if not interaction.guild:
         return await interaction.response.send_message("Use this in a server.", ephemeral=True)
@@ -137,31 +262,77 @@ async def ask(interaction: discord.Interaction, question: str):
             ephemeral=True
         )
 
+    conv = await conversation(interaction.guild.id, interaction.channel_id, interaction.user.id)
+
+    # نفس السؤال سبق جوابه: نرد من الكاش بدون API وبدون خصم من الحد المجاني
+    # (فقط في بداية المحادثة؛ سؤال المتابعة يعتمد على ما قبله)
+    cached = await cached_answer(interaction.guild.id, question) if conv is None or conv.empty else None
+    if cached:
+        if conv is not None:
+            await remember_turn(conv, question, cached)
+        first, *rest = split_text(cached)
+        await interaction.response.send_message(first)
+        for part in rest:
+            await interaction.followup.send(part)
+        return
+
+    persisted = None
     if not is_premium(interaction.guild.id):
-        day = today_key_utc()
-        used_now = await get_daily_usage(interaction.guild.id, day)
-        if used_now >= FREE_DAILY_LIMIT:
-            return await interaction.response.send_message(
-                f"🆓 Free limit reached ({FREE_DAILY_LIMIT}/day). Upgrade to Premium for unlimited AI.",
-                ephemeral=True
-            )
-        new_count = await increment_daily_usage(interaction.guild.id, day)
-        if new_count > FREE_DAILY_LIMIT:
+        if await reserve_daily_usage(interaction.guild.id, today_key_utc(), FREE_DAILY_LIMIT) is None:
             return await interaction.response.send_message(
                 f"🆓 Free limit reached ({FREE_DAILY_LIMIT}/day). Upgrade to Premium for unlimited AI.",
                 ephemeral=True
             )
+        persisted = usage_persisted()
 
+    start = time.perf_counter()
     await interaction.response.defer()
+    reply = StreamingReply(interaction.followup)
     try:
-        r = ai.responses.create(
-            model=OPENAI_MODEL,
-            input=f"You are a helpful Discord assistant. Answer clearly.\n\nUser: {question}"
-        )
-        text = (r.output_text or "").strip() or "⚠️ No response."
-        await interaction.followup.send(text[:1900])
+        # الجواب يظهر أثناء توليده: رسالة followup تُعدّل كل STREAM_EDIT_SECONDS وتنتقل لرسالة جديدة عند 2000 حرف
+        async for chunk in ask_stream(interaction.guild.id, question, conv):
+            if persisted is not None:
+                await persisted  # لا نرسل جواباً مجانياً قبل حفظ العدّاد
+                persisted = None
+            await reply.push(chunk)
+        await reply.finish()
+    except AssistantBusy:
+        await reply.finish(fallback=None)
+        await interaction.followup.send("⏳ The assistant is busy right now. Try again in a moment.")
     except Exception:
+        await reply.finish(fallback=None)  # يزيل المؤشر من الجواب الجزئي قبل رسالة الخطأ
         await interaction.followup.send("⚠️ Something went wrong. Try again later.")
+    finally:
+        if METRICS_ENABLED and reply.first_shown_at is not None:
+            observe("ask_first_text_seconds", reply.first_shown_at - start)
+            observe("ask_total_seconds", time.perf_counter() - start)
+
+@bot.tree.command(name="ask_forget", description="Clear the assistant's memory of your conversation here")
+async def ask_forget(interaction: discord.Interaction):
+    if not interaction.guild:
+        return await interaction.response.send_message("Use this in a server.", ephemeral=True)
+    await forget_conversation(interaction.guild.id, interaction.channel_id, interaction.user.id)
+    await interaction.response.send_message("🧹 Conversation memory cleared.", ephemeral=True)
+
+@bot.tree.command(name="ask_stats", description="Show assistant answer-cache hit rate")
+@app_commands.checks.has_permissions(manage_guild=True)
+async def ask_stats(interaction: discord.Interaction):
+    info = answer_cache_info()
+    await interaction.response.send_message(
+        f"♻️ Answer cache: {info['hit_rate']:.0%} hit rate ({info['hits']} hits / {info['misses']} misses)\n"
+        f"Entries in memory: {info['entries']} ({info['bytes'] // 1024} KiB)",
+        ephemeral=True
+    )
+
+@bot.tree.command(name="p_metrics", description="Bot owner: show hot-path latency histograms and counters")
+async def p_metrics(interaction: discord.Interaction):
+    # أرقام كل السيرفرات معاً (tokens، أحجام الكاش، المحادثات): لصاحب البوت فقط، والمشغّل يستخدم METRICS_FILE/METRICS_PORT
+    if not await bot.is_owner(interaction.user):
+        return await interaction.response.send_message("⛔ Bot owner only.", ephemeral=True)
+    if not METRICS_ENABLED:
+        return await interaction.response.send_message("Metrics are disabled (set METRICS_ENABLED=1).", ephemeral=True)
+    text = "\n".join(summary_lines()) or "No samples yet."
+    await interaction.response.send_message(f"```\n{text[:1900]}\n```", ephemeral=True)
 
 # ====== أوامر الحماية (إعدادات) ======
 def _need_guild(i: discord.Interaction):
@@ -171,7 +342,7 @@ def _need_guild(i: discord.Interaction):
 async def p_status(interaction: discord.Interaction):
     if not _need_guild(interaction):
         return await interaction.response.send_message("Use this in a server.", ephemeral=True)
-    cfg = await get_protection_config(interaction.guild.id)
+    cfg = (await get_guild_snapshot(interaction.guild.id))["config"]
     plan = "💎 Premium" if is_premium(interaction.guild.id) else "🆓 Free"
     await interaction.response.send_message(
         f"{plan}\n"
@@ -217,7 +388,20 @@ async def p_domain_add(interaction: discord.Interaction, domain: str):
 @bot.tree.command(name="p_domain_list", description="List allowed domains")
 async def p_domain_list(interaction: discord.Interaction):
     ds = await list_allowed_domains(interaction.guild.id)
-    await interaction.response.send_message("✅ Allowed domains:\n" + ("\n".join(ds) if ds else "(none)"), ephemeral=True)
+    await _send_list(interaction, "✅ Allowed domains", ds, "allowed_domains.txt")
+
+@bot.tree.command(name="p_domain_remove", description="Remove allowed domains (comma separated)")
+@app_commands.checks.has_permissions(manage_guild=True)
+async def p_domain_remove(interaction: discord.Interaction, domains: str):
+    n = await remove_allowed_domains(interaction.guild.id, domains.split(","))
+    await interaction.response.send_message(f"✅ Removed {n} allowed domain(s).", ephemeral=True)
+
+@bot.tree.command(name="p_domain_import", description="(Premium) Import allowed domains from a .txt/.csv file")
+@app_commands.checks.has_permissions(manage_guild=True)
+async def p_domain_import(interaction: discord.Interaction, file: discord.Attachment, replace: bool = False):
+    if not is_premium(interaction.guild.id):
+        return await interaction.response.send_message("❌ Domains allowlist is Premium.", ephemeral=True)
+    await _import_list(interaction, file, replace, add_allowed_domains, "allowed domain(s)")
 
 @bot.tree.command(name="p_word_add", description="Add a banned word")
 @app_commands.checks.has_permissions(manage_guild=True)
@@ -225,10 +409,73 @@ async def p_word_add(interaction: discord.Interaction, word: str):
     await add_banned_word(interaction.guild.id, word)
     await interaction.response.send_message(f"✅ Banned word added: {word}", ephemeral=True)
 
+@bot.tree.command(name="p_word_remove", description="Remove banned words (comma separated)")
+@app_commands.checks.has_permissions(manage_guild=True)
+async def p_word_remove(interaction: discord.Interaction, words: str):
+    n = await remove_banned_words(interaction.guild.id, words.split(","))
+    await interaction.response.send_message(f"✅ Removed {n} banned word(s).", ephemeral=True)
+
+@bot.tree.command(name="p_word_import", description="Import banned words from a .txt/.csv file (one per line)")
+@app_commands.checks.has_permissions(manage_guild=True)
+async def p_word_import(interaction: discord.Interaction, file: discord.Attachment, replace: bool = False):
+    await _import_list(interaction, file, replace, add_banned_words, "banned word(s)")
+
 @bot.tree.command(name="p_word_list", description="List banned words")
 async def p_word_list(interaction: discord.Interaction):
     ws = await list_banned_words(interaction.guild.id)
-    await interaction.response.send_message("✅ Banned words:\n" + ("\n".join(ws) if ws else "(none)"), ephemeral=True)
+    await _send_list(interaction, "✅ Banned words", ws, "banned_words.txt")
+
+@bot.tree.command(name="p_export", description="Export banned words, allowed domains and bypass roles as files")
+@app_commands.checks.has_permissions(manage_guild=True)
+async def p_export(interaction: discord.Interaction):
+    gid = interaction.guild.id
+    files = [
+        _list_file("banned_words.txt", await list_banned_words(gid)),
+        _list_file("allowed_domains.txt", await list_allowed_domains(gid)),
+        _list_file("bypass_roles.txt", await list_bypass_roles(gid)),
+    ]
+    await interaction.response.send_message("📦 Protection lists (re-import with /p_word_import, /p_domain_import)", files=files, ephemeral=True)
+
+# ---- استيراد / تصدير القوائم ----
+IMPORT_MAX_BYTES = 1024 * 1024
+IMPORT_MAX_ITEMS = 20000
+_LIST_HEADERS = {"word", "words", "domain", "domains", "role", "role_id"}
+
+def parse_list_file(data: bytes, filename: str = "") -> list:
+    # .csv: العمود الأول من كل صف؛ غير ذلك: سطر لكل عنصر. الأسطر الفارغة و# تُتجاهل.
+    text = data.decode("utf-8-sig", errors="replace")
+    if not filename.lower().endswith(".csv"):
+        return [r.strip() for r in text.splitlines() if r.strip() and not r.lstrip().startswith("#")]
+    rows = [row for row in csv.reader(io.StringIO(text)) if row and row[0].strip()]
+    # سطر العنوان يُحذف فقط في CSV متعدد الأعمدة، حتى لا تضيع كلمة حقيقية مثل "word"
+    if rows and len(rows[0]) > 1 and rows[0][0].strip().lower() in _LIST_HEADERS:
+        del rows[0]
+    return [row[0].strip() for row in rows if not row[0].lstrip().startswith("#")]
+
+async def _import_list(interaction: discord.Interaction, file: discord.Attachment, replace: bool, add, label: str):
+    if file.size > IMPORT_MAX_BYTES:
+        return await interaction.response.send_message(f"❌ File too large (max {IMPORT_MAX_BYTES // 1024} KiB).", ephemeral=True)
+    await interaction.response.defer(ephemeral=True, thinking=True)
+    try:
+        items = parse_list_file(await file.read(), file.filename)
+    except discord.HTTPException:
+        return await interaction.followup.send("⚠️ Could not download the file.", ephemeral=True)
+    except (csv.Error, ValueError) as e:
+        return await interaction.followup.send(f"❌ Could not parse the file: {e}", ephemeral=True)
+    if len(items) > IMPORT_MAX_ITEMS:
+        return await interaction.followup.send(f"❌ Too many entries ({len(items)}, max {IMPORT_MAX_ITEMS}).", ephemeral=True)
+    n = await add(interaction.guild.id, items, replace=replace)
+    verb = "Replaced list with" if replace else "Imported"
+    await interaction.followup.send(f"✅ {verb} {n} {label} ({len(items)} lines read).", ephemeral=True)
+
+def _list_file(filename: str, items) -> discord.File:
+    return discord.File(io.BytesIO("\n".join(map(str, items)).encode()), filename=filename)
+
+async def _send_list(interaction: discord.Interaction, title: str, items: list, filename: str):
+    text = f"{title}:\n" + ("\n".join(items) if items else "(none)")
+    if len(text) <= 2000:
+        return await interaction.response.send_message(text, ephemeral=True)
+    await interaction.response.send_message(f"{title} ({len(items)}):", file=_list_file(filename, items), ephemeral=True)
 
 @bot.tree.command(name="p_spam_set", description="Set spam limit (max msgs / window seconds)")
 @app_commands.checks.has_permissions(manage_guild=True)
@@ -253,7 +500,9 @@ async def p_bypassrole_add(interaction: discord.Interaction, role: discord.Role)
     await add_bypass_role(interaction.guild.id, role.id)
     await interaction.response.send_message(f"✅ Bypass role added: {role.mention}", ephemeral=True)
 
-if not DISCORD_TOKEN:
-    raise RuntimeError("DISCORD_TOKEN missing in .env")
+if __name__ == "__main__":
+    if not DISCORD_TOKEN:
+        raise RuntimeError("DISCORD_TOKEN missing in .env")
+
+    bot.run(DISCORD_TOKEN)
 
-bot.run(DISCORD_TOKEN)
@@ -0,0 +1,188 @@
+# metrics.py
+# سجل قياسات داخل العملية: histograms + counters + gauges.
+# معطّل افتراضياً: timed() يعيد الدالة كما هي وباقي النقاط محمية بـ METRICS_ENABLED، فالتكلفة صفر.
+# لقياس التكلفة عند التفعيل:
+#   python bench/bench_pipeline.py --out off.json
+#   METRICS_ENABLED=1 python bench/bench_pipeline.py --compare off.json
+import asyncio
+import os
+import time
+from bisect import bisect_left
+from contextlib import nullcontext
+from functools import wraps
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "0") == "1"
+METRICS_FILE = os.getenv("METRICS_FILE", "")          # مسار ملف Prometheus text يُحدّث دورياً
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))    # 127.0.0.1:PORT/metrics
+METRICS_EXPORT_SECONDS = 15
+LOOP_LAG_INTERVAL = 0.5
+
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        # تقريبي: الحد الأعلى للـ bucket الذي يقع فيه الترتيب المطلوب
+        if not self.count:
+            return 0.0
+        rank, seen = q * self.count, 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank:
+                return BUCKETS[i] if i < len(BUCKETS) else float("inf")
+        return float("inf")
+
+_histograms = {}  # (name, labels) -> Histogram
+_counters = {}    # (name, labels) -> number
+_gauges = {}      # (name, labels) -> callable
+
+def _key(name: str, labels: dict):
+    return (name, tuple(sorted(labels.items())))
+
+def histogram(name: str, **labels) -> Histogram:
+    key = _key(name, labels)
+    h = _histograms.get(key)
+    if h is None:
+        h = _histograms[key] = Histogram()
+    return h
+
+def observe(name: str, value: float, **labels):
+    if METRICS_ENABLED:
+        histogram(name, **labels).observe(value)
+
+def inc(name: str, value: float = 1, **labels):
+    if METRICS_ENABLED:
+        key = _key(name, labels)
+        _counters[key] = _counters.get(key, 0) + value
+
+def gauge(name: str, fn, **labels):
+    _gauges[_key(name, labels)] = fn
+
+def timed(name: str, **labels):
+    def deco(fn):
+        if not METRICS_ENABLED:
+            return fn
+        h = histogram(name, **labels)
+
+        @wraps(fn)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                h.observe(time.perf_counter() - start)
+        return wrapper
+    return deco
+
+class _Timer:
+    __slots__ = ("h", "start")
+
+    def __init__(self, h: Histogram):
+        self.h = h
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.h.observe(time.perf_counter() - self.start)
+
+_NULL = nullcontext()
+
+def timer(name: str, **labels):
+    return _Timer(histogram(name, **labels)) if METRICS_ENABLED else _NULL
+
+# ====== التصدير ======
+def _fmt_labels(labels, extra=()) -> str:
+    pairs = list(labels) + list(extra)
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}" if pairs else ""
+
+def render_prometheus() -> str:
+    out, typed = [], set()
+    for (name, labels), h in sorted(_histograms.items()):
+        if name not in typed:
+            out.append(f"# TYPE {name} histogram")
+            typed.add(name)
+        seen = 0
+        for i, c in enumerate(h.counts):
+            seen += c
+            le = str(BUCKETS[i]) if i < len(BUCKETS) else "+Inf"
+            out.append(f"{name}_bucket{_fmt_labels(labels, [('le', le)])} {seen}")
+        out.append(f"{name}_sum{_fmt_labels(labels)} {h.sum}")
+        out.append(f"{name}_count{_fmt_labels(labels)} {h.count}")
+    for (name, labels), v in sorted(_counters.items()):
+        if name not in typed:
+            out.append(f"# TYPE {name} counter")
+            typed.add(name)
+        out.append(f"{name}{_fmt_labels(labels)} {v}")
+    for (name, labels), fn in sorted(_gauges.items(), key=lambda kv: kv[0]):
+        if name not in typed:
+            out.append(f"# TYPE {name} gauge")
+            typed.add(name)
+        out.append(f"{name}{_fmt_labels(labels)} {fn()}")
+    return "\n".join(out) + "\n"
+
+def summary_lines() -> list:
+    lines = []
+    for (name, labels), h in sorted(_histograms.items()):
+        if not h.count:
+            continue
+        label = ",".join(str(v) for _, v in labels)
+        lines.append(
+            f"{name}[{label}] n={h.count} avg={h.sum / h.count * 1000:.2f}ms "
+            f"p50≤{h.quantile(0.5) * 1000:g}ms p99≤{h.quantile(0.99) * 1000:g}ms"
+        )
+    for (name, labels), v in sorted(_counters.items()):
+        label = ",".join(str(v) for _, v in labels)
+        lines.append(f"{name}[{label}] = {v:g}")
+    for (name, labels), fn in sorted(_gauges.items(), key=lambda kv: kv[0]):
+        label = ",".join(str(v) for _, v in labels)
+        lines.append(f"{name}[{label}] = {fn()}")
+    return lines
+
+async def _loop_lag_monitor():
+    h = histogram("event_loop_lag_seconds")
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        h.observe(max(time.perf_counter() - start - LOOP_LAG_INTERVAL, 0.0))
+
+async def _file_exporter(path: str):
+    while True:
+        await asyncio.sleep(METRICS_EXPORT_SECONDS)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(render_prometheus())
+        os.replace(tmp, path)
+
+async def _serve_http(port: int):
+    from aiohttp import web
+
+    async def handle(request):
+        return web.Response(text=render_prometheus(), content_type="text/plain")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+
+async def start_metrics(spawn):
+    # spawn: من يشغّل المهام الدائمة ويحتفظ بمراجعها (main._spawn)
+    if not METRICS_ENABLED:
+        return
+    spawn(_loop_lag_monitor())
+    if METRICS_FILE:
+        spawn(_file_exporter(METRICS_FILE))
+    if METRICS_PORT:
+        await _serve_http(METRICS_PORT)
@@ -1,9 +1,374 @@
 # protection.py
+import asyncio
+import os
+import re
+import time
+import weakref
+import unicodedata
+from array import array
+from datetime import timedelta
+from operator import attrgetter, itemgetter
 
-def handle_message(message):
-    # هنا يمكنك إضافة الكود الذي يعالج الرسائل
-    pass
+import discord
 
-def handle_member_update_roles(member):
-    # هنا يمكنك إضافة الكود الذي يعالج تحديث الأدوار
-    pass
+from actions import moderation
+from db import normalize_domain
+from metrics import gauge
+
+# ====== تطبيع النص (عربي / لاتيني) ======
+# NFKD يفصل الهمزات والمدّ والتشكيل والحركات اللاتينية كحروف combining فنحذفها
+_COMBINING = re.compile("[\u0300-\u036f\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed]+")
+_FOLD = str.maketrans({"\u0649": "\u064a", "\u0629": "\u0647", "\u0671": "\u0627", "\u0640": None})  # ى→ي ة→ه ٱ→ا ـ
+_SPACES = re.compile(r"\s+")
+
+def normalize_text(text: str) -> str:
+    text = text.casefold()
+    if not text.isascii():
+        text = _COMBINING.sub("", unicodedata.normalize("NFKD", text)).translate(_FOLD)
+    return _SPACES.sub(" ", text)
+
+# ====== فلتر الكلمات الممنوعة ======
+# كل قائمة كلمات تُبنى مرة واحدة كـ regex على شكل trie، ويُفحص النص كاملاً بمرور واحد.
+# المفتاح هو الـ frozenset من لقطة db، فأي إضافة/حذف تنتج قائمة جديدة ويُعاد البناء لذلك السيرفر فقط.
+_word_matchers = weakref.WeakKeyDictionary()
+
+def _trie_pattern(node: dict) -> str:
+    end = "" in node
+    alts, chars = [], []
+    for ch in sorted(k for k in node if k):
+        sub = _trie_pattern(node[ch])
+        if sub:
+            alts.append(re.escape(ch) + sub)
+        else:
+            chars.append(re.escape(ch))
+    if chars:
+        alts.append(chars[0] if len(chars) == 1 else "[" + "".join(chars) + "]")
+    if not alts:
+        return ""
+    pat = "(?:" + "|".join(alts) + ")" if (len(alts) > 1 or end) else alts[0]
+    return pat + "?" if end else pat
+
+def build_word_matcher(words):
+    trie = {}
+    for w in words:
+        w = normalize_text(w).strip()
+        if not w:
+            continue
+        node = trie
+        for ch in w:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+    if not trie:
+        return None
+    return re.compile(r"(?<!\w)" + _trie_pattern(trie) + r"(?!\w)")
+
+def word_matcher(words: frozenset):
+    try:
+        return _word_matchers[words]
+    except KeyError:
+        m = _word_matchers[words] = build_word_matcher(words)
+        return m
+
+# ====== كاشف السبام (نافذة منزلقة) ======
+# لكل (سيرفر، عضو) حلقة ثابتة الحجم من الأوقات بطول spam_max: أقدم وقت هو الخانة التالية للكتابة،
+# فلو كان داخل النافذة فالعضو أرسل spam_max رسائل خلال spam_window. التكلفة O(1) لكل رسالة.
+SPAM_IDLE_SECONDS = 60  # أكبر نافذة مسموحة في /p_spam_set
+SPAM_SWEEP_SECONDS = 15
+SPAM_FLOOD_MIN_CHARS = 10
+
+# حدود التكرار مشتقة من إعداد السيرفر (spam_max / spam_window) وليست ثابتة:
+# نفس الرسالة من نفس العضو نصف spam_max مرة (3 على الأقل) داخل النافذة = تكرار،
+# ونفس الرسالة الطويلة من عدة أعضاء ضعف spam_max (10 على الأقل) داخل النافذة = flood.
+def duplicate_limit(max_msgs: int) -> int:
+    return max(3, max_msgs // 2 + 1)
+
+def flood_limit(max_msgs: int) -> int:
+    return max(10, max_msgs * 2)
+
+# أسباب تستحق timeout؛ الـ flood قد يكون تهنئة جماعية عادية فيُحذف ويُسجّل فقط
+SPAM_TIMEOUT_REASONS = frozenset({"Spam", "Duplicate messages"})
+
+class _SpamTracker:
+    __slots__ = ("times", "pos", "last_seen", "last_hash", "repeats", "repeat_since")
+
+    def __init__(self, size: int):
+        self.times = array("d", bytes(8 * size))
+        self.pos = 0
+        self.last_seen = 0.0
+        self.last_hash = 0
+        self.repeats = 0
+        self.repeat_since = 0.0
+
+_spam = {}    # (guild_id, user_id) -> _SpamTracker
+_floods = {}  # (guild_id, content_hash) -> [count, first_seen]
+gauge("spam_tracked_members", lambda: len(_spam))
+
+def check_spam(guild_id: int, user_id: int, content: str, max_msgs: int, window: int, now: float = None):
+    now = time.monotonic() if now is None else now
+    key = (guild_id, user_id)
+    t = _spam.get(key)
+    if t is None or len(t.times) != max_msgs:
+        t = _spam[key] = _SpamTracker(max_msgs)
+
+    oldest = t.times[t.pos]
+    t.times[t.pos] = now
+    t.pos = t.pos + 1 if t.pos + 1 < max_msgs else 0
+    t.last_seen = now
+    if oldest and now - oldest <= window:
+        return "Spam"
+
+    # نفس الرسالة مكررة من نفس العضو: التكرارات كلها داخل نافذة واحدة تبدأ من أول تكرار
+    h = hash(content.casefold().strip()) if content else 0
+    if h and h == t.last_hash and now - t.repeat_since <= window:
+        t.repeats += 1
+    else:
+        t.last_hash, t.repeats, t.repeat_since = h, 1, now
+    if h and t.repeats >= duplicate_limit(max_msgs):
+        return "Duplicate messages"
+
+    # نفس الرسالة من عدة أعضاء (raid)
+    if h and len(content) >= SPAM_FLOOD_MIN_CHARS:
+        f = _floods.get((guild_id, h))
+        if f is None or now - f[1] > window:
+            _floods[(guild_id, h)] = [1, now]
+        else:
+            f[0] += 1
+            if f[0] >= flood_limit(max_msgs):
+                return "Duplicate flood"
+    return None
+
+def _expire(table: dict, keys, cutoff: float, seen):
+    for key in keys:
+        entry = table.get(key)
+        if entry is not None and seen(entry) < cutoff:
+            del table[key]
+
+_SWEEPS = ((_spam, attrgetter("last_seen")), (_floods, itemgetter(1)))
+
+def sweep_spam(now: float = None):
+    cutoff = (time.monotonic() if now is None else now) - SPAM_IDLE_SECONDS
+    for table, seen in _SWEEPS:
+        _expire(table, list(table), cutoff, seen)
+
+async def spam_sweeper(chunk: int = 5000):
+    # على دفعات حتى لا يتوقف الـ event loop أثناء raid فيه عشرات الآلاف
+    while True:
+        await asyncio.sleep(SPAM_SWEEP_SECONDS)
+        for table, seen in _SWEEPS:
+            keys = list(table)
+            for i in range(0, len(keys), chunk):
+                _expire(table, keys[i:i + chunk], time.monotonic() - SPAM_IDLE_SECONDS, seen)
+                await asyncio.sleep(0)
+
+# ====== فلتر الروابط والدعوات ======
+# regex واحد مُجهّز مسبقاً يستخرج الدعوات (حتى المموّهة مثل discord(.)gg و dsc.gg) والروابط
+# بمرور واحد. روابط markdown [نص](رابط) تُلتقط من الرابط نفسه.
+# الرابط الملتقط يُفحص أيضاً بحثاً عن دعوة داخله (redirect مثل ?q=https://discord.gg/...).
+_DOT = r"\s*(?:\.|\(\.\)|\[\.\]|\{\.\}|\(dot\)|\[dot\]|\sdot\s)\s*"
+_INVITE = r"(?:https?://)?(?:www\.)?(?:discord(?:app)?" + _DOT + r"(?:gg|io|me|li|com\s*/\s*invite)|dsc" + _DOT + r"gg)\s*/\s*[\w-]+"
+_LINKS = re.compile(
+    r"(?P<invite>" + _INVITE + r")"
+    r"|(?P<url>(?:https?://|www\.)[^\s<>\"'`)\]|]+)",
+    re.IGNORECASE,
+)
+_INVITE_IN_URL = re.compile(_INVITE, re.IGNORECASE)
+_URL_TRAILING = ".,!?;:"  # علامات ترقيم بعد الرابط في الجملة وليست منه
+
+def domain_allowed(host: str, domains: frozenset) -> bool:
+    # نفحص الدومين ثم كل لاحقة أب له: a.b.example.com ← b.example.com ← example.com (O(labels))
+    if not host or not domains:
+        return False
+    while True:
+        if host in domains:
+            return True
+        dot = host.find(".")
+        if dot < 0:
+            return False
+        host = host[dot + 1:]
+
+def find_blocked_link(content: str, mode: str, domains: frozenset):
+    for m in _LINKS.finditer(content):
+        if m.group("invite"):
+            return "Invite link"
+        url = m.group("url").rstrip(_URL_TRAILING)
+        if _INVITE_IN_URL.search(url):
+            return "Invite link"
+        if mode == "all" and not domain_allowed(normalize_domain(url), domains):
+            return "Link"
+    return None
+
+# ====== تنفيذ العقوبة ======
+def _punish(message, cfg, reason: str, timeout: bool = False):
+    # لا ننتظر REST هنا: المنفّذ يجمع الحذف/الـ timeout/اللوق ويرسلها على دفعات
+    q = moderation()
+    q.delete(message.channel.id, message.id)
+    seconds = int(cfg.get("timeout_seconds") or 0)
+    if timeout and seconds > 0:
+        q.timeout(message.guild.id, message.author.id, seconds, reason)
+    log_id = cfg.get("log_channel_id")
+    if log_id:
+        q.log(log_id, f"🛡️ {reason}: {message.author.mention} in {message.channel.mention}")
+
+async def handle_message(message, cfg, words, domains, premium):
+    if message.author.bot or not cfg:
+        return
+    perms = getattr(message.author, "guild_permissions", None)
+    if perms is not None and perms.manage_messages:
+        return
+
+    if int(cfg.get("spam_enabled") or 0) == 1:
+        reason = check_spam(
+            message.guild.id, message.author.id, message.content,
+            int(cfg["spam_max"]), int(cfg["spam_window"])
+        )
+        if reason:
+            _punish(message, cfg, reason, timeout=reason in SPAM_TIMEOUT_REASONS)
+            return
+
+    if int(cfg.get("links_enabled") or 0) == 1 and message.content:
+        mode = cfg.get("links_mode") if premium else "invites"
+        reason = find_blocked_link(message.content, mode, domains)
+        if reason:
+            _punish(message, cfg, reason)
+            return
+
+    if words and message.content:
+        matcher = word_matcher(words)
+        if matcher and matcher.search(normalize_text(message.content)):
+            _punish(message, cfg, "Banned word")
+            return
+
+# ====== حماية الرتب ======
+# on_member_update يصل مع كل تغيير (nickname، avatar، ...): نخرج فوراً لو الرتب لم تتغير، بدون SQL.
+# الرتب "الخطيرة" لكل سيرفر تُحسب مرة واحدة من bitmask الصلاحيات وتُحدّث مع أحداث إنشاء/تعديل/حذف الرتب.
+# المنح المتتالية تُجمع لمدة ROLE_BURST_SECONDS ثم يُحسم أمرها مرة لكل منفّذ (من الـ audit log):
+# سحب الرتب (Premium) + سطر لوق واحد، بدل قرار وطلب REST لكل عضو أثناء nuke.
+DANGEROUS_PERMISSIONS = discord.Permissions(
+    administrator=True, manage_guild=True, manage_roles=True, manage_channels=True,
+    manage_webhooks=True, ban_members=True, kick_members=True, moderate_members=True,
+).value
+ROLE_BURST_SECONDS = float(os.getenv("ROLE_BURST_SECONDS", "1.5"))
+ROLE_NUKE_MEMBERS = int(os.getenv("ROLE_NUKE_MEMBERS", "3"))  # منح لهذا العدد في دفعة واحدة = سحب رتب المنفّذ أيضاً
+
+_dangerous = {}  # guild_id -> frozenset(role_id)
+_bursts = {}     # guild_id -> _RoleBurst
+_settling = set()  # مهام _settle_burst الجارية
+
+class _RoleBurst:
+    __slots__ = ("guild", "since", "members", "cfg", "bypass", "premium")
+
+    def __init__(self, guild):
+        self.guild = guild
+        # هامش قبل أول حدث: سجل الـ audit قد يسبق وصول on_member_update
+        self.since = discord.utils.time_snowflake(discord.utils.utcnow() - timedelta(seconds=5))
+        self.members = {}  # user_id -> set(role_id)
+
+def dangerous_roles(guild) -> frozenset:
+    roles = _dangerous.get(guild.id)
+    if roles is None:
+        roles = _dangerous[guild.id] = frozenset(
+            r.id for r in guild.roles if r.permissions.value & DANGEROUS_PERMISSIONS
+        )
+    return roles
+
+def refresh_dangerous_roles(guild):
+    # يُستدعى من أحداث الرتب؛ السيرفر الذي لم يُحسب بعد يبقى كسولاً
+    if guild.id in _dangerous:
+        del _dangerous[guild.id]
+        dangerous_roles(guild)
+
+def forget_dangerous_roles(guild_id: int):
+    _dangerous.pop(guild_id, None)
+
+def role_ids(member) -> frozenset:
+    ids = getattr(member, "_roles", None)  # SnowflakeList في discord.py: بدون بناء كائنات Role
+    return frozenset(ids if ids is not None else (r.id for r in member.roles))
+
+def roles_gained(before, after) -> frozenset:
+    b, a = getattr(before, "_roles", None), getattr(after, "_roles", None)
+    if a is not None and b is not None and a == b:
+        return frozenset()
+    return role_ids(after) - role_ids(before)
+
+async def handle_member_update_roles(before, after, cfg, bypass, premium, gained=None):
+    if gained is None:
+        gained = roles_gained(before, after)
+    if not gained or not cfg or int(cfg.get("roles_enabled") or 0) != 1:
+        return
+    guild = after.guild
+    risky = gained & dangerous_roles(guild)
+    # رتبة التجاوز تُحسب من قبل التعديل: منحها مع رتبة خطيرة في نفس التعديل لا يعفي العضو
+    if not risky or (bypass and not bypass.isdisjoint(role_ids(before))):
+        return
+
+    burst = _bursts.get(guild.id)
+    if burst is None:
+        burst = _bursts[guild.id] = _RoleBurst(guild)
+        task = asyncio.ensure_future(_settle_burst(guild.id, burst))
+        _settling.add(task)
+        task.add_done_callback(_settling.discard)
+    burst.cfg, burst.bypass, burst.premium = cfg, bypass, premium
+    burst.members.setdefault(after.id, set()).update(risky)
+
+async def _settle_burst(guild_id: int, burst: _RoleBurst):
+    await asyncio.sleep(ROLE_BURST_SECONDS)
+    if _bursts.get(guild_id) is burst:
+        del _bursts[guild_id]
+    actors = await _grant_actors(burst)
+    by_actor = {}
+    for user_id, roles in burst.members.items():
+        by_actor.setdefault(actors.get(user_id), {})[user_id] = roles
+    for actor_id, members in by_actor.items():
+        _decide_grants(burst, actor_id, members)
+
+async def drain_role_bursts():
+    # ينتظر حسم كل الدفعات المعلّقة (عند الإغلاق، وفي الـ bench)
+    while _settling:
+        await asyncio.gather(*list(_settling), return_exceptions=True)
+
+async def _grant_actors(burst: _RoleBurst) -> dict:
+    data = await moderation().role_audit(burst.guild.id, after=burst.since)
+    entries = data.get("audit_log_entries", []) if isinstance(data, dict) else []
+    found = {}
+    for e in entries:
+        if e.get("target_id") and e.get("user_id") and any(c.get("key") == "$add" for c in e.get("changes") or ()):
+            found.setdefault(int(e["target_id"]), int(e["user_id"]))
+    # الـ audit log يرجع 100 سجل فقط: لو كل ما في النافذة من منفّذ واحد فهو صاحب الباقي أيضاً
+    actors = set(found.values())
+    default = next(iter(actors)) if len(actors) == 1 else None
+    return {user_id: found.get(user_id, default) for user_id in burst.members}
+
+def _trusted_actor(burst: _RoleBurst, actor_id: int) -> bool:
+    guild = burst.guild
+    me = getattr(guild, "me", None)
+    if actor_id == getattr(guild, "owner_id", None) or (me is not None and actor_id == me.id):
+        return True
+    get_member = getattr(guild, "get_member", None)
+    member = get_member(actor_id) if get_member else None
+    return bool(member is not None and burst.bypass and not burst.bypass.isdisjoint(role_ids(member)))
+
+def _decide_grants(burst: _RoleBurst, actor_id, members: dict):
+    if actor_id is not None and _trusted_actor(burst, actor_id):
+        return
+    guild, q = burst.guild, moderation()
+    who = f"<@{actor_id}>" if actor_id else "unknown actor"
+    action = "logged (Free)"
+    if burst.premium:
+        reason = f"Role protection: dangerous role granted by {actor_id or 'unknown'}"
+        for user_id, roles in members.items():
+            q.remove_roles(guild.id, user_id, roles, reason)
+        action = "reverted"
+        get_member = getattr(guild, "get_member", None)
+        actor = get_member(actor_id) if (get_member and actor_id) else None
+        if actor is not None and len(members) >= ROLE_NUKE_MEMBERS:
+            own = role_ids(actor) & dangerous_roles(guild)
+            if own:
+                q.remove_roles(guild.id, actor_id, own, "Role protection: mass dangerous role grants")
+                action = "reverted, actor's dangerous roles removed"
+
+    log_id = burst.cfg.get("log_channel_id")
+    if log_id:
+        roles = sorted(set().union(*members.values()))
+        names = ", ".join(f"<@&{r}>" for r in roles[:10]) + (" …" if len(roles) > 10 else "")
+        hint = "" if actor_id else " (give the bot View Audit Log)"
+        q.log(log_id, f"🛡️ Dangerous role grant by {who}{hint}: {len(members)} member(s) got {names} — {action}")
@@ -0,0 +1,77 @@
+# replies.py
+# إرسال أجوبة المساعد لديسكورد: تقسيم النص الطويل على حدود منطقية، وعرض الجواب أثناء توليده.
+import os
+import time
+
+MESSAGE_LIMIT = 2000
+STREAM_EDIT_SECONDS = float(os.getenv("STREAM_EDIT_SECONDS", "1.2"))  # ديسكورد يسمح بحوالي 5 تعديلات / 5 ث
+_CURSOR = " ▌"
+_FENCE = "```"
+_BREAKS = ("\n\n", "\n", ". ", "? ", "! ", "، ", ", ", " ")
+
+def split_once(text: str, limit: int = MESSAGE_LIMIT):
+    # يقطع قبل الحد عند أفضل فاصل (فقرة ← سطر ← جملة ← كلمة) بشرط ألا يكون في النصف الأول،
+    # ولو انقطع داخل ``` يُغلق الكود ويُعاد فتحه في الجزء التالي.
+    if len(text) <= limit:
+        return text, ""
+    room = limit - len(_FENCE) - 1
+    cut = room
+    for sep in _BREAKS:
+        i = text.rfind(sep, room // 2, room)
+        if i >= 0:
+            cut = i + len(sep)
+            break
+    head, tail = text[:cut].rstrip(), text[cut:].lstrip()
+    if head.count(_FENCE) % 2:
+        head += "\n" + _FENCE
+        tail = _FENCE + "\n" + tail
+    return head, tail
+
+def split_text(text: str, limit: int = MESSAGE_LIMIT) -> list:
+    parts = []
+    while text:
+        head, text = split_once(text, limit)
+        parts.append(head)
+    return parts
+
+class StreamingReply:
+    """Shows a growing answer in followup messages, editing at most every `interval` seconds."""
+
+    def __init__(self, followup, interval: float = STREAM_EDIT_SECONDS, limit: int = MESSAGE_LIMIT):
+        self.followup = followup
+        self.interval = interval
+        self.limit = limit
+        self.text = ""        # نص الرسالة الحالية (لم يكتمل بعد)
+        self.message = None
+        self.shown = None
+        self.last_edit = 0.0
+        self.messages = 0
+        self.first_shown_at = None
+
+    async def push(self, delta: str):
+        self.text = (self.text + delta) if self.message or self.text else delta.lstrip()
+        # مكان للمؤشر أثناء الكتابة حتى لا تتجاوز الرسالة الحد
+        while len(self.text) > self.limit - len(_CURSOR):
+            head, self.text = split_once(self.text, self.limit - len(_CURSOR))
+            await self._show(head)
+            self.message = None
+        if self.text and time.monotonic() - self.last_edit >= self.interval:
+            await self._show(self.text + _CURSOR)
+
+    async def finish(self, fallback: str = "⚠️ No response."):
+        text = self.text.rstrip()
+        if text:
+            await self._show(text)
+        elif fallback and not self.messages:
+            await self._show(fallback)
+
+    async def _show(self, content: str):
+        if self.message is None:
+            self.message = await self.followup.send(content, wait=True)
+            self.messages += 1
+            if self.first_shown_at is None:
+                self.first_shown_at = time.perf_counter()
+        elif content != self.shown:
+            await self.message.edit(content=content)
+        self.shown = content
+        self.last_edit = time.monotonic()